@@ -1,34 +1,40 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 import logging
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
-from app.core.config import settings
+from app.core.conditional import (
+    DATARANGE_CACHE_CONTROL,
+    make_etag,
+    matches,
+    not_modified,
+    set_validators,
+)
+from app.core.db import fetch_one as _fetch_one
+from app.core.watermark import watermark
 
 router = APIRouter()
 
 
-def _fetch_one(sql: str, params: tuple = ()): 
-    conn = psycopg2.connect(settings.DATABASE_URL)
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SET statement_timeout TO %s",
-                (settings.STATEMENT_TIMEOUT,),
-            )
-            cur.execute(sql, params)
-            return cur.fetchone() or {}
-    finally:
-        conn.close()
-
-
 @router.get("/data-range")
-def data_range(cube: str = Query(..., pattern="^(sales|products|payments)$")):
+def data_range(
+    request: Request,
+    response: Response,
+    cube: str = Query(..., pattern="^(sales|products|payments)$"),
+):
     """Retorna o intervalo [min_date, max_date] disponível por cube.
     Baseado em DATE(created_at). Útil para a UI limitar filtros de período
     ao que existe no banco.
+
+    O ETag acompanha o watermark de vendas (MAX(id), MAX(created_at)):
+    enquanto não houver vendas novas, If-None-Match recebe 304 sem
+    consultar o banco, em qualquer réplica.
     """
     cube = cube.lower()
+    etag = None
+    tag = watermark.tag()
+    if tag is not None:
+        etag = make_etag("data-range", cube, tag)
+        if matches(request, etag):
+            return not_modified(etag, DATARANGE_CACHE_CONTROL)
     try:
         if cube == "sales":
             row = _fetch_one(
@@ -67,6 +73,7 @@ def data_range(cube: str = Query(..., pattern="^(sales|products|payments)$")):
 
     min_date = row.get("min_date")
     max_date = row.get("max_date")
+    set_validators(response, etag, DATARANGE_CACHE_CONTROL)
     return {
         "cube": cube,
         "min_date": str(min_date) if min_date else None,
@@ -6,19 +6,30 @@ POST /api/distinct
     a lista de valores únicos.
 - Usa o translator para garantir que a dimensão é permitida pelo papel
     (role) e aplicar filtros.
-- Cacheia por 300s com chave derivada do corpo da requisição.
+- Cacheia com chave derivada do SQL canônico e stale-while-revalidate
+    (DISTINCT_CACHE_TTL de 300s, ver core/results.py); misses
+    simultâneos da mesma chave são coalescidos (core/singleflight.py).
+- O cache guarda os valores já serializados (core/serialize.py) e a
+    resposta leva ETag para revalidação com 304 (core/conditional.py).
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional, Literal
 
-import json
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
+from app.core.cache import make_key
+from app.core.conditional import (
+    QUERY_CACHE_CONTROL,
+    digest,
+    make_etag,
+    matches,
+    not_modified,
+    set_validators,
+)
 from app.core.config import settings
-from app.core.cache import ttl_cache
-from app.domain.translator import build_sql
+from app.core.executor import fetch_all
+from app.core.results import get_or_load
+from app.core.serialize import dumps, json_response
+from app.domain.translator import build_sql, canonicalize, time_range
 
 
 router = APIRouter()
@@ -51,22 +62,8 @@ class DistinctRequest(BaseModel):
                     )
 
 
-def fetch_all(sql: str, params: list):
-    conn = psycopg2.connect(settings.DATABASE_URL)
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SET statement_timeout TO %s",
-                (settings.STATEMENT_TIMEOUT,),
-            )
-            cur.execute(sql, params)
-            return cur.fetchall()
-    finally:
-        conn.close()
-
-
 @router.post("/distinct")
-def get_distinct(req: DistinctRequest):
+async def get_distinct(req: DistinctRequest, request: Request):
     try:
         req.validate_security()
     except ValueError as e:
@@ -75,18 +72,16 @@ def get_distinct(req: DistinctRequest):
     # Contruímos um SELECT apenas com a dimensão e um GROUP BY,
     # limitando o resultado. Reutiliza o build_sql para respeitar
     # whitelists por role e aplicar filtros com segurança.
-    key = json.dumps(req.model_dump(), sort_keys=True)
-    cached = ttl_cache.get(key)
-    if cached is not None:
-        return {"cached": True, "values": cached["values"]}
-
     try:
+        _, _, filters = canonicalize(
+            [], [], [f.model_dump() for f in req.filters]
+        )
         sql, params, columns = build_sql(
             cube=req.cube,
             role=req.role,
             measures=[],
             dimensions=[req.dimension],
-            filters=[f.model_dump() for f in req.filters],
+            filters=filters,
             granularity=req.granularity,
             order=[{"by": req.dimension, "dir": "asc"}],
             limit=max(1, min(req.limit, 10000)),
@@ -94,12 +89,31 @@ def get_distinct(req: DistinctRequest):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    rows = fetch_all(sql, params)
-    # extrair apenas a coluna da dimensão
-    values = []
-    col = req.dimension
-    for r in rows:
-        if col in r:
-            values.append(r[col])
-    ttl_cache.set(key, {"values": values}, ttl_seconds=300)
-    return {"cached": False, "values": values}
+    async def load(request: Optional[Request]):
+        rows = await fetch_all(sql, params, request=request)
+        # extrair apenas a coluna da dimensão
+        values = []
+        col = req.dimension
+        for r in rows:
+            if col in r:
+                values.append(r[col])
+        values_json = dumps(values)
+        return {"values_json": values_json, "digest": digest(values_json)}
+
+    key = make_key("distinct", sql, params)
+    result, cached = await get_or_load(
+        key,
+        load,
+        ttl=settings.DISTINCT_CACHE_TTL,
+        hard_ttl=settings.DISTINCT_CACHE_HARD_TTL,
+        request=request,
+        scope=time_range(filters, req.granularity),
+        cost=lambda value: len(value["values_json"]),
+    )
+    etag = make_etag(key, result["digest"])
+    if matches(request, etag):
+        return not_modified(etag, QUERY_CACHE_CONTROL)
+    response = json_response(
+        {"cached": cached, "values": result["values_json"]}
+    )
+    return set_validators(response, etag, QUERY_CACHE_CONTROL)
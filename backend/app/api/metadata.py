@@ -5,24 +5,39 @@ GET /api/metadata
 - Lê o arquivo domain/model.yaml com a declaração de cubos,
   dimensões, medidas e papéis.
 - Retorna a estrutura para o frontend montar o Explorer e validar entradas.
+- ETag = hash do model.yaml: If-None-Match igual recebe 304 sem nem
+  interpretar o YAML (core/conditional.py).
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from pathlib import Path
 import yaml
 
+from app.core.conditional import (
+    METADATA_CACHE_CONTROL,
+    digest,
+    make_etag,
+    matches,
+    not_modified,
+    set_validators,
+)
+
 router = APIRouter()
 
+MODEL_PATH = Path(__file__).resolve().parent.parent / "domain" / "model.yaml"
+
 
 def load_model() -> dict:
     """Carrega o modelo semântico (cubes, dimensões, medidas e papéis)."""
-    model_path = (
-        Path(__file__).resolve().parent.parent / "domain" / "model.yaml"
-    )
-    with model_path.open("r", encoding="utf-8") as f:
+    with MODEL_PATH.open("r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
 
 @router.get("/metadata")
-def get_metadata():
-    model = load_model()
+def get_metadata(request: Request, response: Response):
+    raw = MODEL_PATH.read_bytes()
+    etag = make_etag("metadata", digest(raw))
+    if matches(request, etag):
+        return not_modified(etag, METADATA_CACHE_CONTROL)
+    model = yaml.safe_load(raw)
+    set_validators(response, etag, METADATA_CACHE_CONTROL)
     return {"cubes": model.get("cubes", {}), "roles": model.get("roles", {})}
@@ -0,0 +1,51 @@
+"""
+Métricas operacionais do backend.
+
+GET /api/metrics
+- pool: saturação do pool de conexões (em uso, ociosas, aguardando,
+    tempo de espera no checkout, timeouts e conexões descartadas).
+- async_pool: estatísticas do pool psycopg 3 (QUERY_BACKEND=async).
+- cache: hits, misses, despejos, expirações e ocupação do cache.
+- singleflight: execuções no banco vs. misses duplicados coalescidos.
+- refresh: recargas em background (stale-while-revalidate/chaves quentes).
+- plans: formatos de consulta compilados em cache (translator) e
+    prepared statements do backend sync.
+- compression: codificações disponíveis e cache de corpos comprimidos.
+- costguard: orçamento padrão, EXPLAINs, recusas, amostragens e fila.
+- derive: consultas respondidas reagregando resultados mais finos.
+- factviews: atualizações das materialized views e dias cobertos.
+- rollups: atualizações das tabelas de rollup do cube sales.
+- warmup: progresso do aquecimento do cache no startup.
+- watermark: último id/created_at de sales visto e entradas invalidadas.
+"""
+from fastapi import APIRouter
+
+from app import warmup
+from app.core import compression, costguard, factviews, results, rollups
+from app.core.cache import ttl_cache
+from app.core.db import prepared_stats
+from app.core.derive import derive_index
+from app.core.executor import pool_stats
+from app.core.singleflight import single_flight
+from app.core.watermark import watermark
+from app.domain.translator import compile_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def get_metrics():
+    return {
+        **pool_stats(),
+        "cache": ttl_cache.stats(),
+        "singleflight": single_flight.stats(),
+        "refresh": results.stats(),
+        "plans": {"compiled": compile_stats(), **prepared_stats()},
+        "compression": compression.stats(),
+        "costguard": costguard.stats(),
+        "derive": derive_index.stats(),
+        "factviews": factviews.stats(),
+        "rollups": rollups.stats(),
+        "warmup": warmup.stats(),
+        "watermark": watermark.stats(),
+    }
@@ -6,30 +6,149 @@ POST /api/query
     granularidade, ordenação, limite).
 - Converte a Query em SQL via translator.build_sql, valida papéis
     (role) e whitelist.
-- Executa no PostgreSQL com RealDictCursor e aplica statement_timeout
-    para evitar travas.
-- Cacheia o resultado por 120s usando uma chave derivada do corpo JSON.
+- Executa no PostgreSQL via core/executor.py (QUERY_BACKEND async ou
+    sync); os pools já aplicam statement_timeout em cada sessão.
+- Cacheia o resultado usando uma chave derivada do SQL canônico
+    (translator.canonicalize + cache.make_key) com stale-while-revalidate:
+    após QUERY_CACHE_TTL (120s) o resultado ainda é servido e recarregado
+    em background, até QUERY_CACHE_HARD_TTL (core/results.py).
+- Requisições idênticas simultâneas que erram o cache são coalescidas
+    (core/singleflight.py): apenas uma executa no banco.
+- Num miss, tenta derivar o resultado de outro mais fino já em cache
+    (ex.: mês a partir de dia, total a partir de por canal) reagregando
+    em processo (core/derive.py).
+- O cache guarda as linhas já serializadas (core/serialize.py): hits
+    respondem os bytes direto, sem o jsonable_encoder.
+- Responde com ETag (chave + digest do resultado); If-None-Match igual
+    recebe 304 sem corpo (core/conditional.py).
+- Streaming: com Accept application/x-ndjson ou text/csv (ou
+    ?format=ndjson|csv) as linhas saem em lotes de STREAM_BATCH_SIZE,
+    lidas por um cursor no servidor e codificadas lote a lote; a memória
+    por requisição não cresce com o número de linhas. Não passa pelo
+    cache nem tem ETag.
+- top_n ({"by": medida, "n": N}): os N grupos com maior "by" em rows,
+    mais "others" (restante reagregado, ou null) e "total" (todos os
+    grupos), calculados num só SQL (translator). Não usa a derivação.
+- approximate ({"percent": p, "method": "system"|"bernoulli"}): lê uma
+    amostra de p% da tabela fato (TABLESAMPLE), com medidas aditivas
+    escaladas e uma coluna "<medida>_stderr" por medida; a resposta traz
+    "approximate". Resposta direcional rápida; sem approximate, exata.
+- compare ("previous_period" | "previous_year"): o filtro de time.date
+    é o período atual; cada medida "m" vem com "m_previous" e "m_delta",
+    lidos no mesmo SQL (translator.compare_periods). Não aceita time.date
+    como dimensão nem usa a derivação.
+- Controle de custo (core/costguard.py, COST_GUARD_ENABLED): para
+    roles com budget no model.yaml, só quando a consulta vai mesmo ao
+    banco (miss do cache sem derivação, dentro do singleflight, ou
+    streaming) o EXPLAIN é comparado ao orçamento.
+    Acima dele a consulta é recusada (422 com a estimativa), refeita em
+    modo approximate (COST_GUARD_SAMPLE_PERCENT) ou entra na fila de
+    consultas caras, conforme a política. A estimativa fica no resultado
+    em cache e a resposta a traz em "estimate". Como o load aplica o
+    orçamento de quem o disparou, a chave de cache de uma role sob
+    orçamento inclui o orçamento (costguard.namespace): amostras e 422
+    não vazam para roles com outro orçamento ou sem controle.
+- Formatos compactos (opcionais): ?format=columnar responde
+    {"columns", "data"} com uma lista de valores por coluna; Accept
+    application/vnd.apache.arrow.stream (ou ?format=arrow) responde Arrow
+    IPC, se o pyarrow estiver instalado (senão 406). Ambos saem das
+    linhas em cache, com ETag próprio por formato.
+
+POST /api/query/batch
+- Recebe {"queries": [...]} (até MAX_BATCH Queries, ex.: um dashboard
+    inteiro) e compila todas antes de executar qualquer uma.
+- Executa as válidas concorrentemente (cache, derivação ou pool), então
+    o tempo total é o da consulta mais lenta, não a soma.
+- Responde {"results": [...]} na ordem recebida: cada item traz cached,
+    rows e columns, ou error e status (400 inválida, 503 pool saturado,
+    504 timeout) sem derrubar os demais.
+- Sem erros, o ETag combina os ETags dos itens (304 como em /query).
+- O orçamento de custo vale por item (422 com "estimate" se recusado).
+
+POST /api/query/estimate
+- Mesma Query de /query, sem executar: {"cost", "rows", "max_cost",
+    "max_rows", "policy", "action"} do EXPLAIN e do orçamento da role,
+    para a UI avisar antes de rodar uma consulta cara.
+
+POST /api/query/grouping-sets
+- Mesmas medidas e filtros quebrados de várias formas: "groupings" (até
+    MAX_GROUPINGS listas de dimensões; [] é o total geral) no lugar de
+    "dimensions".
+- Compila um único GROUP BY GROUPING SETS (translator) e separa as
+    linhas por quebra pelo GROUPING(): uma leitura da tabela fato em vez
+    de uma por gráfico. order e limit valem por quebra.
+- Responde {"cached", "sets": [{"dimensions", "columns", "rows"}]} na
+    ordem das quebras, com cache e ETag como em /query.
+- Passa pelo orçamento de custo como /query; sem modo amostrado, a
+    política approximate recusa.
 
 Dicas:
 - O campo "order" só pode ordenar por colunas selecionadas
     (validado no translator).
 - O "limit" é clamped no translator para proteger o banco (máx. 10.000).
 """
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import List, Optional, Literal
-import json
-
+import anyio
+import asyncio
+import logging
+import psycopg
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from dataclasses import dataclass
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Literal, Tuple
 
+from app.core import costguard
+from app.core.cache import Scope, estimate_size, make_key
+from app.core.conditional import (
+    QUERY_CACHE_CONTROL,
+    digest,
+    make_etag,
+    matches,
+    not_modified,
+    set_validators,
+)
 from app.core.config import settings
-from app.core.cache import ttl_cache
-from app.domain.translator import build_sql
+from app.core.db import PoolTimeout
+from app.core.db_async import QueryTimeout
+from app.core.derive import Shape, derive_index
+from app.core.executor import fetch_all, iter_batches
+from app.core.results import get_or_load
+from app.core.serialize import (
+    arrow_available,
+    arrow_ipc,
+    columnar,
+    csv_lines,
+    dumps,
+    json_response,
+    ndjson_lines,
+)
+from app.domain.translator import (
+    build_grouping_sets_sql,
+    build_sql,
+    canonicalize,
+    role_budget,
+    time_range,
+)
 
+logger = logging.getLogger("uvicorn.error")
 
 router = APIRouter()
 
+# Queries por chamada de /query/batch
+MAX_BATCH = 20
+# Quebras por chamada de /query/grouping-sets
+MAX_GROUPINGS = 10
+
+# Formatos de streaming de /query: (media type, codificador de um lote)
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_lines),
+    "csv": ("text/csv; charset=utf-8", csv_lines),
+}
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+# Formatos aceitos em ?format=
+FORMATS = ("json", "columnar", "arrow", *STREAM_FORMATS)
+
 
 class Filter(BaseModel):
     dimension: str
@@ -42,6 +161,16 @@ class OrderSpec(BaseModel):
     dir: Literal["asc", "desc"] = "desc"
 
 
+class TopN(BaseModel):
+    by: str
+    n: int = Field(default=10, ge=1, le=1000)
+
+
+class Approximate(BaseModel):
+    percent: float = Field(default=1.0, gt=0, le=100)
+    method: Literal["system", "bernoulli"] = "system"
+
+
 class QueryRequest(BaseModel):
     role: Optional[str] = Field(
         default=None,
@@ -54,6 +183,9 @@ class QueryRequest(BaseModel):
     granularity: Optional[Literal["hour", "day", "month"]] = None
     order: List[OrderSpec] = []
     limit: int = 100
+    top_n: Optional[TopN] = None
+    approximate: Optional[Approximate] = None
+    compare: Optional[Literal["previous_period", "previous_year"]] = None
 
     def validate_security(self):
         # Limites para evitar abusos
@@ -75,53 +207,561 @@ class QueryRequest(BaseModel):
                     )
 
 
-def fetch_all(sql: str, params: list):
-    conn = psycopg2.connect(settings.DATABASE_URL)
+class QueryBatchRequest(BaseModel):
+    queries: List[QueryRequest] = Field(
+        min_length=1, max_length=MAX_BATCH
+    )
+
+
+class GroupingSetsRequest(BaseModel):
+    role: Optional[str] = None
+    cube: Literal["sales", "products", "payments"]
+    measures: List[str]
+    groupings: List[List[str]] = Field(
+        min_length=1, max_length=MAX_GROUPINGS
+    )
+    filters: List[Filter] = []
+    granularity: Optional[Literal["hour", "day", "month"]] = None
+    order: List[OrderSpec] = []
+    limit: int = 100
+
+    def validate_security(self):
+        # Mesmos limites de uma Query com as dimensões de todas as quebras
+        QueryRequest(
+            role=self.role,
+            cube=self.cube,
+            measures=self.measures,
+            dimensions=list(
+                dict.fromkeys(d for g in self.groupings for d in g)
+            ),
+            filters=self.filters,
+        ).validate_security()
+
+
+@dataclass
+class CompiledQuery:
+    """Query validada e compilada na forma canônica."""
+
+    sql: str
+    params: List[Any]
+    key: str
+    shape: Shape
+    scope: Scope
+    # colunas na ordem pedida pelo cliente
+    columns: List[str]
+    # resultado top_n: rows + others + total
+    top_n: bool = False
+    # amostragem pedida (approximate), ou None se exata
+    approximate: Optional[Dict[str, Any]] = None
+    # período de comparação (compare), ou None
+    compare: Optional[str] = None
+    # Query de origem: budget da role e recompilação amostrada (costguard)
+    req: Optional[QueryRequest] = None
+
+    @property
+    def derivable(self) -> bool:
+        """Resultados top_n, aproximados e comparados ficam de fora."""
+        return (
+            not self.top_n
+            and self.approximate is None
+            and self.compare is None
+        )
+
+
+def compile_query(req: QueryRequest) -> CompiledQuery:
+    """Valida e compila a Query; ValueError se for inválida."""
+    # Regras de segurança adicionais
+    req.validate_security()
+
+    # Compila a forma canônica: consultas equivalentes (ordem de medidas,
+    # dimensões, filtros ou valores; papéis distintos com o mesmo SQL)
+    # geram o mesmo SQL e compartilham a entrada de cache.
+    measures, dimensions, filters = canonicalize(
+        req.measures,
+        req.dimensions,
+        [f.model_dump() for f in req.filters],
+    )
+    order = [o.model_dump() for o in req.order]
+    approximate = req.approximate.model_dump() if req.approximate else None
+    sql, params, _ = build_sql(
+        cube=req.cube,
+        role=req.role,
+        measures=measures,
+        dimensions=dimensions,
+        filters=filters,
+        granularity=req.granularity,
+        order=order,
+        limit=req.limit,
+        top_n=req.top_n.model_dump() if req.top_n else None,
+        sample=approximate,
+        compare=req.compare,
+    )
+    columns = list(dict.fromkeys(req.dimensions + req.measures))
+    if approximate:
+        columns += [f"{m}_stderr" for m in dict.fromkeys(req.measures)]
+    if req.compare:
+        columns += [
+            f"{m}_{suffix}"
+            for m in dict.fromkeys(req.measures)
+            for suffix in ("previous", "delta")
+        ]
+    return CompiledQuery(
+        sql=sql,
+        params=params,
+        key=make_key(
+            costguard.namespace("query", role_budget(req.role)), sql, params
+        ),
+        shape=Shape(
+            req.cube,
+            filters,
+            dimensions,
+            measures,
+            req.granularity,
+            order,
+            req.limit,
+        ),
+        scope=time_range(filters, req.granularity),
+        # As linhas são dicionários por nome de coluna: basta reprojetar
+        # a lista de colunas na ordem pedida pelo cliente.
+        columns=columns,
+        top_n=req.top_n is not None,
+        approximate=approximate,
+        compare=req.compare,
+        req=req,
+    )
+
+
+async def admit(
+    q: CompiledQuery,
+) -> Tuple[CompiledQuery, Optional[Dict[str, Any]]]:
+    """Aplica o orçamento de custo da role antes de ir ao banco.
+
+    Devolve o que executar e a estimativa (None se a role não tem budget:
+    sem EXPLAIN). Acima do orçamento: OverBudget (reject), a mesma Query
+    em modo approximate, ou a própria consulta com estimate["action"] ==
+    "queue" (executar dentro de costguard.slot).
+    """
+    limits = role_budget(q.req.role if q.req else None)
+    if not costguard.guarded(limits):
+        return q, None
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Proteção contra consultas longas
-            cur.execute(
-                "SET statement_timeout TO %s",
-                (settings.STATEMENT_TIMEOUT,),
+        found = await costguard.check(q.sql, q.params, limits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if found["action"] == "approximate" and q.approximate is None:
+        sample = Approximate(percent=settings.COST_GUARD_SAMPLE_PERCENT)
+        try:
+            sampled = compile_query(
+                q.req.model_copy(update={"approximate": sample})
+            )
+        except ValueError:
+            # top_n, compare ou medida sem estimador: não dá para amostrar
+            sampled = None
+        if sampled is not None:
+            costguard.record("approximate")
+            return sampled, found
+    if found["action"] in ("reject", "approximate"):
+        costguard.record("reject")
+        raise costguard.OverBudget({**found, "action": "reject"})
+    return q, found
+
+
+def _top_n_result(
+    rows: List[Dict[str, Any]], measures: List[str]
+) -> Dict[str, Any]:
+    """Separa as partes do SQL top_n: grupos, "outros" e total."""
+    parts: Dict[int, List[Dict[str, Any]]] = {0: [], 1: [], 2: []}
+    for row in rows:
+        part = row.pop("__part")
+        row.pop("__rank")
+        parts[part].append(row)
+    others, total = (
+        {m: p[0][m] for m in measures} if p else None
+        for p in (parts[1], parts[2])
+    )
+    return {"rows": parts[0], "others": others, "total": total}
+
+
+def _result_cost(result: Dict[str, Any]) -> int:
+    """Bytes no cache: o JSON das linhas mais as próprias linhas.
+
+    rows (dicts com Decimal/date, para derivação, columnar e Arrow) ocupa
+    várias vezes o JSON; cobrar só o JSON deixaria CACHE_MAX_BYTES sem
+    limitar a memória de fato.
+    """
+    return len(result["rows_json"]) + estimate_size(result["rows"])
+
+
+async def execute(
+    q: CompiledQuery, request: Optional[Request] = None
+) -> Tuple[Dict[str, Any], bool]:
+    """Resultado da query (cache, derivação ou banco) e se veio do cache.
+
+    O resultado traz rows, rows_json (serializado) e digest; com top_n,
+    também others e total. Se o controle de custo estimou a consulta,
+    traz estimate; se a refez amostrada, também approximate e columns.
+    """
+
+    async def load(request: Optional[Request]):
+        # Só deriva em requisições do cliente; recargas vão ao banco
+        derived = None
+        if request is not None and q.derivable:
+            derived = derive_index.derive(q.key, q.shape)
+        if derived is not None:
+            (rows, as_of), run, found = derived, q, None
+        else:
+            # Só o que vai mesmo ao banco passa pelo orçamento de custo
+            run, found = await admit(q)
+            async with costguard.slot(found):
+                rows = await fetch_all(run.sql, run.params, request=request)
+            as_of = None
+        if q.top_n:
+            result = _top_n_result(rows, list(q.shape.measures))
+            rows_json = dumps(result["rows"])
+            extras = dumps([result["others"], result["total"]])
+            result["rows_json"] = rows_json
+            result["digest"] = digest(rows_json + extras)
+        else:
+            # a amostra (run.approximate) não entra na derivação
+            if run.derivable:
+                derive_index.register(q.key, q.shape, rows, as_of)
+            # rows fica para a derivação; rows_json vai na resposta
+            rows_json = dumps(rows)
+            result = {
+                "rows": rows,
+                "rows_json": rows_json,
+                "digest": digest(rows_json),
+            }
+        if run is not q:
+            result["approximate"] = run.approximate
+            result["columns"] = run.columns
+        if found is not None:
+            result["estimate"] = found
+        return result
+
+    return await get_or_load(
+        q.key,
+        load,
+        ttl=settings.QUERY_CACHE_TTL,
+        hard_ttl=settings.QUERY_CACHE_HARD_TTL,
+        request=request,
+        scope=q.scope,
+        cost=_result_cost,
+    )
+
+
+def _columns(q: CompiledQuery, result: Dict[str, Any]) -> List[str]:
+    """Colunas do resultado (as da amostra, se o orçamento a impôs)."""
+    return result.get("columns", q.columns)
+
+
+def _extras(q: CompiledQuery, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos extras: others/total, approximate, compare e estimate."""
+    extras: Dict[str, Any] = {}
+    if q.top_n:
+        extras["others"] = result["others"]
+        extras["total"] = result["total"]
+    approximate = result.get("approximate", q.approximate)
+    if approximate is not None:
+        extras["approximate"] = approximate
+    if q.compare is not None:
+        extras["compare"] = q.compare
+    if "estimate" in result:
+        extras["estimate"] = result["estimate"]
+    return extras
+
+
+def response_format(request: Request) -> str:
+    """Formato da resposta pedido em ?format= ou no Accept."""
+    fmt = request.query_params.get("format")
+    if fmt is not None:
+        if fmt not in FORMATS:
+            raise HTTPException(
+                status_code=400, detail=f"Formato inválido: {fmt}"
             )
-            cur.execute(sql, params)
-            return cur.fetchall()
-    finally:
-        conn.close()
+        return fmt
+    accept = request.headers.get("accept", "")
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    for fmt, (media_type, _) in STREAM_FORMATS.items():
+        if media_type.split(";")[0] in accept:
+            return fmt
+    return "json"
+
+
+class _CursorStreamingResponse(StreamingResponse):
+    """StreamingResponse que sempre roda cleanup ao terminar.
+
+    O corpo pode nunca chegar a ser iterado (cliente desconecta antes,
+    erro num middleware): o finally de um gerador não iniciado não roda,
+    então o cursor e a vaga da fila são liberados aqui, em qualquer
+    saída de __call__.
+    """
+
+    def __init__(self, content, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # mesmo cancelado, o cleanup precisa terminar
+            with anyio.CancelScope(shield=True):
+                await self.cleanup()
+
+
+async def stream_query(q: CompiledQuery, fmt: str) -> StreamingResponse:
+    media_type, encode = STREAM_FORMATS[fmt]
+    # sem cache, todo stream vai ao banco: passa pelo orçamento de custo
+    q, found = await admit(q)
+    # a vaga da fila (política queue) fica presa até o fim do stream
+    queued = await costguard.acquire(found)
+    batches = iter_batches(q.sql, q.params, settings.STREAM_BATCH_SIZE)
+    # O primeiro lote vem antes dos headers: pool saturado, timeout ou
+    # erro de SQL ainda viram o status HTTP de sempre
+    try:
+        first = await batches.__anext__()
+    except StopAsyncIteration:
+        first = []
+    except BaseException:
+        if queued:
+            costguard.release()
+        raise
+
+    async def body():
+        if fmt == "csv":
+            yield csv_lines([dict(zip(q.columns, q.columns))], q.columns)
+        if first:
+            yield encode(first, q.columns)
+        async for rows in batches:
+            yield encode(rows, q.columns)
+
+    stream = body()
+    released = False
+
+    async def cleanup():
+        nonlocal released
+        if released:
+            return
+        released = True
+        await stream.aclose()
+        # fecha o cursor e devolve a conexão já, sem esperar o GC
+        await batches.aclose()
+        if queued:
+            costguard.release()
+
+    return _CursorStreamingResponse(
+        stream,
+        cleanup,
+        media_type=media_type,
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 @router.post("/query")
-def run_query(req: QueryRequest):
-    # Regras de segurança adicionais
+async def run_query(req: QueryRequest, request: Request):
     try:
-        req.validate_security()
+        q = compile_query(req)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # cache key
-    key = json.dumps(req.model_dump(), sort_keys=True)
-    cached = ttl_cache.get(key)
-    if cached is not None:
-        return {
-            "cached": True,
-            "rows": cached["rows"],
-            "columns": cached["columns"],
-        }
+    fmt = response_format(request)
+    if fmt == "arrow" and not arrow_available():
+        raise HTTPException(
+            status_code=406, detail="Formato arrow requer o pyarrow"
+        )
+    if fmt in STREAM_FORMATS and q.top_n:
+        # "outros" e total viriam como linhas comuns, sem marcação
+        raise HTTPException(
+            status_code=400,
+            detail=f"top_n não é suportado no formato {fmt}",
+        )
+    if fmt in STREAM_FORMATS:
+        return await stream_query(q, fmt)
+
+    result, cached = await execute(q, request)
+    columns = _columns(q, result)
+    etag = make_etag(q.key, result["digest"], *columns)
+    if fmt != "json":
+        etag = make_etag(etag, fmt)
+    if matches(request, etag):
+        return not_modified(etag, QUERY_CACHE_CONTROL)
+    if fmt == "arrow":
+        response = Response(
+            content=arrow_ipc(result["rows"], columns),
+            media_type=ARROW_MEDIA_TYPE,
+            headers={"X-Cached": "true" if cached else "false"},
+        )
+    elif fmt == "columnar":
+        response = json_response({
+            "cached": cached,
+            "columns": columns,
+            "data": columnar(result["rows"], columns),
+            **_extras(q, result),
+        })
+    else:
+        response = json_response({
+            "cached": cached,
+            "rows": result["rows_json"],
+            "columns": columns,
+            **_extras(q, result),
+        })
+    return set_validators(response, etag, QUERY_CACHE_CONTROL)
 
+
+async def _run_batch_item(
+    q: CompiledQuery, request: Request
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """(item da resposta, ETag do item ou None se falhou)."""
     try:
-        sql, params, columns = build_sql(
+        result, cached = await execute(q, request)
+    except HTTPException as e:
+        return {"error": e.detail, "status": e.status_code}, None
+    except costguard.OverBudget as e:
+        return {"error": str(e), "status": 422, "estimate": e.estimate}, None
+    except PoolTimeout as e:
+        return {"error": str(e), "status": 503}, None
+    except QueryTimeout as e:
+        return {"error": str(e), "status": 504}, None
+    except (psycopg.errors.QueryCanceled, psycopg2.errors.QueryCanceled):
+        # statement_timeout no servidor: mesmo status do QueryTimeout
+        item = {"error": "Consulta excedeu o tempo limite", "status": 504}
+        return item, None
+    except (psycopg.Error, psycopg2.Error):
+        # erro do banco numa query não derruba as demais do lote
+        logger.exception("Falha numa query do lote")
+        return {"error": "Erro ao executar a consulta", "status": 500}, None
+    columns = _columns(q, result)
+    etag = make_etag(q.key, result["digest"], *columns)
+    item = {
+        "cached": cached,
+        "rows": result["rows_json"],
+        "columns": columns,
+        **_extras(q, result),
+    }
+    return item, etag
+
+
+@router.post("/query/batch")
+async def run_query_batch(batch: QueryBatchRequest, request: Request):
+    # Valida tudo antes de executar: erros de uma query não atrasam
+    # nem cancelam as outras
+    compiled: List[Any] = []
+    for req in batch.queries:
+        try:
+            compiled.append(compile_query(req))
+        except ValueError as e:
+            compiled.append({"error": str(e), "status": 400})
+
+    async def run(entry):
+        if isinstance(entry, CompiledQuery):
+            return await _run_batch_item(entry, request)
+        return entry, None
+
+    outcomes = await asyncio.gather(*(run(entry) for entry in compiled))
+    results = [item for item, _ in outcomes]
+    etags = [etag for _, etag in outcomes]
+    if any(etag is None for etag in etags):
+        return json_response({"results": results})
+    etag = make_etag(*etags)
+    if matches(request, etag):
+        return not_modified(etag, QUERY_CACHE_CONTROL)
+    response = json_response({"results": results})
+    return set_validators(response, etag, QUERY_CACHE_CONTROL)
+
+
+@router.post("/query/grouping-sets")
+async def run_grouping_sets(req: GroupingSetsRequest, request: Request):
+    try:
+        req.validate_security()
+        measures, _, filters = canonicalize(
+            req.measures, [], [f.model_dump() for f in req.filters]
+        )
+        sql, params, dims, masks = build_grouping_sets_sql(
             cube=req.cube,
             role=req.role,
-            measures=req.measures,
-            dimensions=req.dimensions,
-            filters=[f.model_dump() for f in req.filters],
+            measures=measures,
+            groupings=req.groupings,
+            filters=filters,
             granularity=req.granularity,
             order=[o.model_dump() for o in req.order],
             limit=req.limit,
         )
+        limits = role_budget(req.role)
+        key = make_key(
+            costguard.namespace("grouping_sets", limits), sql, params
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    rows = fetch_all(sql, params)
-    ttl_cache.set(key, {"rows": rows, "columns": columns}, ttl_seconds=120)
-    return {"cached": False, "rows": rows, "columns": columns}
+    async def load(request: Optional[Request]):
+        # Orçamento de custo só na ida ao banco; sem amostra aqui
+        found = None
+        if costguard.guarded(limits):
+            try:
+                found = await costguard.check(sql, params, limits)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if found["action"] in ("reject", "approximate"):
+                costguard.record("reject")
+                raise costguard.OverBudget({**found, "action": "reject"})
+        async with costguard.slot(found):
+            rows = await fetch_all(sql, params, request=request)
+        by_mask: Dict[int, List[Dict[str, Any]]] = {m: [] for m in masks}
+        for row in rows:
+            mask = row["__grouping"]
+            # só as dimensões da quebra (bit 0 em GROUPING)
+            by_mask.setdefault(mask, []).append({
+                **{
+                    d: row[d]
+                    for i, d in enumerate(dims)
+                    if not mask >> (len(dims) - 1 - i) & 1
+                },
+                **{m: row[m] for m in measures},
+            })
+        sets_json = {m: dumps(rows) for m, rows in by_mask.items()}
+        joined = b"".join(sets_json[m] for m in sorted(sets_json))
+        result = {"sets_json": sets_json, "digest": digest(joined)}
+        if found is not None:
+            result["estimate"] = found
+        return result
+
+    result, cached = await get_or_load(
+        key,
+        load,
+        ttl=settings.QUERY_CACHE_TTL,
+        hard_ttl=settings.QUERY_CACHE_HARD_TTL,
+        request=request,
+        scope=time_range(filters, req.granularity),
+        cost=lambda value: sum(map(len, value["sets_json"].values())),
+    )
+    sets = [
+        {
+            "dimensions": grouping,
+            "columns": list(dict.fromkeys(grouping + req.measures)),
+            "rows": result["sets_json"][mask],
+        }
+        for grouping, mask in zip(req.groupings, masks)
+    ]
+    etag = make_etag(
+        key, result["digest"], *(",".join(s["columns"]) for s in sets)
+    )
+    if matches(request, etag):
+        return not_modified(etag, QUERY_CACHE_CONTROL)
+    body: Dict[str, Any] = {"cached": cached, "sets": sets}
+    if "estimate" in result:
+        body["estimate"] = result["estimate"]
+    response = json_response(body)
+    return set_validators(response, etag, QUERY_CACHE_CONTROL)
+
+
+@router.post("/query/estimate")
+async def estimate_query(req: QueryRequest):
+    try:
+        q = compile_query(req)
+        return await costguard.check(
+            q.sql, q.params, role_budget(req.role)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -7,18 +7,13 @@ Rotas utilitárias/rápidas para facilitar validação e demos.
 """
 from fastapi import APIRouter, HTTPException
 from datetime import date
-import psycopg2
 from psycopg2.extras import RealDictCursor
 
-from app.core.config import settings
+from app.core.db import pool
 
 router = APIRouter()
 
 
-def _conn():
-    return psycopg2.connect(settings.DATABASE_URL)
-
-
 @router.get("/quick/overview")
 def quick_overview():
     """Resumo do mês atual: faturamento, pedidos e ticket médio (COMPLETED)."""
@@ -50,12 +45,8 @@ def quick_overview():
         WHERE s.sale_status_desc = 'COMPLETED'
           AND s.created_at >= %s AND s.created_at < %s
     """
-    with _conn() as conn:
+    with pool.connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SET statement_timeout TO %s",
-                (settings.STATEMENT_TIMEOUT,),
-            )
             cur.execute(sql, (start, end))
             row = cur.fetchone()
 
@@ -76,7 +67,7 @@ def health_db():
     para debug em produção).
     """
     try:
-        with _conn() as conn:
+        with pool.connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(
                     "SELECT version() AS version, current_database() AS db"
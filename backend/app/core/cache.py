@@ -1,30 +1,271 @@
 """
-Cache simples em memória com TTL.
+Cache em memória com TTL, limite de entradas e orçamento de bytes.
 
-- Armazena pares (valor, expiração) por chave.
 - Usado para respostas de /api/query (120s) e /api/distinct (300s).
+- Despejo LRU: ao passar de CACHE_MAX_ENTRIES ou CACHE_MAX_BYTES, as
+    entradas menos usadas recentemente saem primeiro.
+- Cada entrada tem um custo aproximado em bytes (estimado ou informado
+    pelo chamador em set(..., cost=...)). Entradas acima de
+    CACHE_MAX_ITEM_BYTES não são admitidas, para que um único resultado
+    enorme não despeje centenas de KPIs pequenos.
+- Expiradas são varridas em background (tarefa "cache-sweep") e não
+    apenas quando alguém lê a chave de novo.
+- Dois TTLs por entrada: após o soft TTL a entrada fica "stale" (ainda
+    servida, mas deve ser recarregada); após o hard TTL ela sai. O
+    recarregamento fica em core/results.py, usando o loader guardado.
+- Entradas podem declarar o intervalo de datas que leem (scope); quando
+    o watermark dos dados avança (core/watermark.py), invalidate_from()
+    remove apenas as que se sobrepõem aos dias alterados.
+- stats() expõe hits/misses/despejos/tamanho para GET /api/metrics.
+- make_key deriva a chave do SQL compilado + parâmetros: consultas
+    equivalentes (ver translator.canonicalize) compartilham a entrada.
 - Em produção, considere trocar por Redis para instâncias múltiplas.
 """
+import hashlib
+import json
+import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core import tasks
+from app.core.config import settings
+
+# Quantos itens de uma coleção medimos para extrapolar o tamanho total
+_SIZE_SAMPLE = 20
+
+
+def make_key(namespace: str, sql: str, params: List[Any]) -> str:
+    """Chave estável para um SQL compilado (sem depender do papel)."""
+    raw = json.dumps([sql, params], default=str, separators=(",", ":"))
+    return f"{namespace}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def estimate_size(value: Any) -> int:
+    """Tamanho aproximado (bytes) de um valor, amostrando coleções."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[:_SIZE_SAMPLE]
+        if sample:
+            part = sum(estimate_size(k) + estimate_size(v) for k, v in sample)
+            size += part * len(items) // len(sample)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = value if isinstance(value, (list, tuple)) else list(value)
+        sample = items[:_SIZE_SAMPLE]
+        if sample:
+            part = sum(estimate_size(v) for v in sample)
+            size += part * len(items) // len(sample)
+    return size
+
+
+# Intervalo de datas (inclusivo) lido por uma entrada; None = sem limite
+Scope = Tuple[Optional[date], Optional[date]]
+
+
+class _Entry:
+    __slots__ = (
+        "value", "stale_at", "expires_at", "cost", "loader", "scope", "hits"
+    )
+
+    def __init__(
+        self,
+        value: Any,
+        stale_at: float,
+        expires_at: float,
+        cost: int,
+        loader: Optional[Callable],
+        scope: Optional[Scope],
+    ):
+        self.value = value
+        self.stale_at = stale_at
+        self.expires_at = expires_at
+        self.cost = cost
+        self.loader = loader
+        self.scope = scope
+        self.hits = 0
 
 
 class TTLCache:
-    def __init__(self):
-        self._store: Dict[str, Any] = {}
+    def __init__(
+        self,
+        max_entries: int = 2000,
+        max_bytes: int = 128 * 1024 * 1024,
+        max_item_bytes: Optional[int] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.max_item_bytes = max_item_bytes or self.max_bytes // 8
+        self._store: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._rejections = 0
+        self._stale_hits = 0
+        self._invalidations = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.cost
+
+    def lookup(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """Retorna (valor, stale) ou None se ausente/expirada."""
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            now = time.time()
+            if now > entry.expires_at:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._store.move_to_end(key)
+            self._hits += 1
+            entry.hits += 1
+            stale = now > entry.stale_at
+            if stale:
+                self._stale_hits += 1
+            return entry.value, stale
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Lê sem afetar LRU/contadores (None se ausente ou expirada)."""
+        with self._lock:
+            entry = self._store.get(key)
+            if entry is None or time.time() > entry.expires_at:
+                return None
+            return entry.value
 
     def get(self, key: str) -> Optional[Any]:
-        item = self._store.get(key)
-        if not item:
-            return None
-        value, expires_at = item
-        if time.time() > expires_at:
-            self._store.pop(key, None)
-            return None
-        return value
+        found = self.lookup(key)
+        return found[0] if found is not None else None
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl_seconds: int = 120,
+        cost: Optional[int] = None,
+        soft_ttl_seconds: Optional[int] = None,
+        loader: Optional[Callable] = None,
+        scope: Optional[Scope] = None,
+    ) -> bool:
+        """Armazena value; retorna False se a entrada não foi admitida.
+
+        ttl_seconds é o hard TTL; soft_ttl_seconds (padrão: igual ao
+        hard) marca a partir de quando a entrada é servida como stale.
+        scope=None deixa a entrada fora da invalidação por watermark.
+        """
+        if cost is None:
+            cost = estimate_size(value)
+        now = time.time()
+        soft = ttl_seconds if soft_ttl_seconds is None else soft_ttl_seconds
+        with self._lock:
+            self._remove(key)
+            if cost > self.max_item_bytes:
+                self._rejections += 1
+                return False
+            self._store[key] = _Entry(
+                value,
+                now + min(soft, ttl_seconds),
+                now + ttl_seconds,
+                cost,
+                loader,
+                scope,
+            )
+            self._bytes += cost
+            while (
+                len(self._store) > self.max_entries
+                or self._bytes > self.max_bytes
+            ):
+                _, old = self._store.popitem(last=False)
+                self._bytes -= old.cost
+                self._evictions += 1
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._store.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Remove as entradas expiradas; retorna quantas saíram."""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._store.items() if now > e.expires_at]
+            for key in expired:
+                self._remove(key)
+            self._expirations += len(expired)
+            return len(expired)
+
+    def invalidate_from(self, day: date) -> int:
+        """Remove entradas cujo scope alcança day ou datas posteriores."""
+        with self._lock:
+            affected = [
+                k
+                for k, e in self._store.items()
+                if e.scope is not None
+                and (e.scope[1] is None or e.scope[1] >= day)
+            ]
+            for key in affected:
+                self._remove(key)
+            self._invalidations += len(affected)
+            return len(affected)
+
+    def hot_keys(
+        self, min_hits: int, horizon_seconds: float
+    ) -> List[Tuple[str, Callable]]:
+        """Entradas recarregáveis, com min_hits acessos desde a última
+        carga, que ficam stale dentro de horizon_seconds."""
+        limit = time.time() + horizon_seconds
+        with self._lock:
+            return [
+                (k, e.loader)
+                for k, e in self._store.items()
+                if e.loader is not None
+                and e.hits >= min_hits
+                and e.stale_at <= limit
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._store),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "max_item_bytes": self.max_item_bytes,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "hit_ratio": (
+                    round(self._hits / lookups, 3) if lookups else 0.0
+                ),
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "rejections": self._rejections,
+            }
 
-    def set(self, key: str, value: Any, ttl_seconds: int = 120) -> None:
-        self._store[key] = (value, time.time() + ttl_seconds)
 
+ttl_cache = TTLCache(
+    max_entries=settings.CACHE_MAX_ENTRIES,
+    max_bytes=settings.CACHE_MAX_BYTES,
+    max_item_bytes=settings.CACHE_MAX_ITEM_BYTES,
+)
 
-ttl_cache = TTLCache()
+tasks.register(
+    "cache-sweep", settings.CACHE_SWEEP_INTERVAL, ttl_cache.purge_expired
+)
@@ -0,0 +1,241 @@
+"""
+Compressão das respostas HTTP negociada por Accept-Encoding.
+
+- Middleware ASGI puro: gzip sempre (zlib); br e zstd quando os pacotes
+    opcionais brotli / zstandard estão instalados. Entre as codificações
+    aceitas com o mesmo q, preferimos zstd > br > gzip.
+- Só comprime tipos de texto/JSON/NDJSON/CSV/Arrow sem Content-Encoding
+    e com pelo menos COMPRESSION_MIN_SIZE bytes; COMPRESSION_LEVEL (1-9)
+    vale para as três codificações.
+- Respostas em streaming (more_body) são comprimidas pedaço a pedaço,
+    com flush a cada pedaço para o cliente receber as linhas sem esperar
+    o fim.
+- Respostas inteiras passam por um cache LRU (COMPRESSION_CACHE_BYTES)
+    indexado pela codificação e pelo digest do corpo: um payload quente
+    (ex.: bytes pré-serializados do cache de consultas) é comprimido uma
+    vez e servido muitas.
+- stats() expõe hits/misses do cache e bytes antes/depois para
+    GET /api/metrics.
+"""
+import re
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.conditional import digest
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # opcional: sem br
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # opcional: sem zstd
+    zstandard = None
+
+# (feed, finish): feed comprime e faz flush de um pedaço; finish encerra
+Encoder = Tuple[Callable[[bytes], bytes], Callable[[], bytes]]
+
+_COMPRESSIBLE = re.compile(
+    r"^(text/|application/(json|x-ndjson|vnd\.apache\.arrow\.stream))"
+)
+
+
+def _gzip(level: int) -> Encoder:
+    # wbits=31: formato gzip (cabeçalho + CRC)
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return (
+        lambda data: c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH),
+        c.flush,
+    )
+
+
+def _brotli(level: int) -> Encoder:
+    c = brotli.Compressor(quality=level)
+    return (lambda data: c.process(data) + c.flush(), c.finish)
+
+
+def _zstd(level: int) -> Encoder:
+    c = zstandard.ZstdCompressor(level=level).compressobj()
+    return (
+        lambda data: c.compress(data)
+        + c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK),
+        c.flush,
+    )
+
+
+# em ordem de preferência
+ENCODERS: Dict[str, Callable[[int], Encoder]] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+ENCODERS["gzip"] = _gzip
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Melhor codificação disponível aceita pelo cliente, ou None."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        m = re.search(r"q=([0-9.]+)", params)
+        if m:
+            try:
+                q = float(m.group(1))
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for name in ENCODERS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class CompressedCache:
+    """LRU de corpos comprimidos com orçamento de bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def compress(self, encoding: str, body: bytes) -> bytes:
+        key = (encoding, digest(body))
+        data = self._data.get(key)
+        if data is not None:
+            self._data.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            feed, finish = ENCODERS[encoding](settings.COMPRESSION_LEVEL)
+            data = feed(body) + finish()
+            if len(data) <= self.max_bytes:
+                self._data[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, old = self._data.popitem(last=False)
+                    self._bytes -= len(old)
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "encodings": list(ENCODERS),
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+compressed_cache = CompressedCache(settings.COMPRESSION_CACHE_BYTES)
+
+
+class _Responder:
+    """Intercepta o send de uma resposta e comprime o corpo."""
+
+    def __init__(self, send: Send, encoding: str):
+        self.send = send
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        # None até o primeiro pedaço; depois "identity" ou "stream"
+        self.mode: Optional[str] = None
+        self.encoder: Optional[Encoder] = None
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.mode is None:
+            await self._first(body, more, message)
+        elif self.mode == "identity":
+            await self.send(message)
+        else:
+            feed, finish = self.encoder
+            data = feed(body) if more else feed(body) + finish()
+            await self.send({
+                "type": "http.response.body",
+                "body": data,
+                "more_body": more,
+            })
+
+    async def _first(self, body: bytes, more: bool, message: Message):
+        headers = MutableHeaders(raw=self.start["headers"])
+        compressible = bool(
+            _COMPRESSIBLE.match(headers.get("content-type", ""))
+        )
+        if compressible:
+            headers.add_vary_header("Accept-Encoding")
+        if (
+            not compressible
+            or "content-encoding" in headers
+            or (not more and len(body) < settings.COMPRESSION_MIN_SIZE)
+        ):
+            self.mode = "identity"
+            await self.send(self.start)
+            await self.send(message)
+            return
+        headers["Content-Encoding"] = self.encoding
+        if not more:
+            data = compressed_cache.compress(self.encoding, body)
+            headers["Content-Length"] = str(len(data))
+            self.mode = "identity"
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": data})
+            return
+        # streaming: tamanho final desconhecido
+        del headers["Content-Length"]
+        self.mode = "stream"
+        self.encoder = ENCODERS[self.encoding](settings.COMPRESSION_LEVEL)
+        await self.send(self.start)
+        await self.send({
+            "type": "http.response.body",
+            "body": self.encoder[0](body),
+            "more_body": True,
+        })
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(send, encoding))
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.COMPRESSION_ENABLED,
+        **compressed_cache.stats(),
+    }
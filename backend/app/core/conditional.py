@@ -0,0 +1,64 @@
+"""
+Requisições condicionais HTTP (ETag / If-None-Match -> 304).
+
+- ETags são fracas (W/"..."): identificam o conteúdo, não os bytes
+    exatos (a resposta pode ser comprimida ou trazer "cached" diferente).
+- Consultas (/api/query, /api/distinct): o ETag sai da chave de cache e
+    de um digest do resultado serializado, calculado uma vez na carga;
+    enquanto o watermark não invalida a entrada, o ETag é o mesmo.
+- Metadata: hash do model.yaml; data-range: versão do watermark.
+- Se o If-None-Match do cliente casa com o ETag, respondemos 304 sem
+    corpo (nem serialização).
+"""
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+# Cache-Control por endpoint. POST não entra no cache do navegador: o
+# frontend guarda o ETag e reenvia If-None-Match (ver frontend/src/api.js)
+QUERY_CACHE_CONTROL = "private, no-cache"
+METADATA_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+DATARANGE_CACHE_CONTROL = "public, max-age=30"
+
+
+def digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def make_etag(*parts: Any) -> str:
+    raw = "\x1f".join(str(p) for p in parts).encode("utf-8")
+    return f'W/"{digest(raw)}"'
+
+
+def _opaque(tag: str) -> str:
+    # comparação fraca (RFC 9110): ignora o prefixo W/
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(request: Request, etag: str) -> bool:
+    """True se o If-None-Match da requisição casa com etag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(t) == wanted for t in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(
+        status_code=304,
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
+
+
+def set_validators(
+    response: Response, etag: Optional[str], cache_control: str
+) -> Response:
+    if etag is not None:
+        response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
@@ -4,6 +4,32 @@ Configurações de aplicação carregadas via variáveis de ambiente.
 - DATABASE_URL: string de conexão do PostgreSQL.
 - ALLOW_ORIGINS: lista de origens permitidas no CORS (separadas por vírgula).
 - STATEMENT_TIMEOUT: timeout de execução por consulta no Postgres.
+- DB_POOL_*: dimensionamento e health check do pool de conexões.
+- CACHE_*: limites do cache em memória (entradas, bytes, varredura) e
+  recarga proativa de chaves quentes.
+- QUERY_CACHE_* / DISTINCT_CACHE_*: soft TTL (stale-while-revalidate)
+  e hard TTL das respostas de /api/query e /api/distinct.
+- WATERMARK_INTERVAL / CACHE_CLOSED_TTL: invalidação por watermark dos
+  dados e TTL longo para consultas de períodos fechados.
+- QUERY_BACKEND: "async" (psycopg 3) ou "sync" (psycopg2 no threadpool)
+  para /api/query e /api/distinct.
+- PREPARED_STATEMENTS: prepared statements no servidor para o SQL do
+  translator (desligue atrás de pgbouncer em modo transaction).
+- COMPRESSION_*: compressão das respostas (gzip; br/zstd se instalados),
+  tamanho mínimo, nível e cache dos corpos comprimidos.
+- STREAM_BATCH_SIZE: linhas por FETCH nas respostas em streaming
+  (NDJSON/CSV) de /api/query.
+- COST_GUARD_*: controle de admissão por custo estimado (EXPLAIN) de
+  /api/query, só para roles com budget no model.yaml: orçamento padrão,
+  política acima dele, amostra do modo approximate, fila de consultas
+  caras e cache das estimativas.
+- ROLLUPS_ENABLED / ROLLUP_REFRESH_* / ROLLUP_RECONCILE_INTERVAL:
+  roteamento do cube sales para as tabelas de rollup (db/rollups.sql),
+  sua atualização incremental e a reconciliação completa periódica.
+- FACT_VIEWS_*: leitura das materialized views de fatos (db/views.sql)
+  e intervalo do REFRESH CONCURRENTLY.
+- WARMUP_*: aquecimento do cache no startup com as consultas dos
+  dashboards (domain/warmup.yaml); /ready só fica pronto ao terminar.
 
 Nota: usamos field(default_factory=...) para evitar mutáveis como default
 (boa prática).
@@ -31,6 +57,143 @@ class Settings:
     ALLOW_ORIGINS: List[str] = field(default_factory=_default_allow_origins)
     # Timeout padrão de execução no Postgres (ex.: "15s", "5min")
     STATEMENT_TIMEOUT: str = os.getenv("STATEMENT_TIMEOUT", "15s")
+    # Pool de conexões compartilhado pelas rotas (ver core/db.py)
+    DB_POOL_MIN: int = int(os.getenv("DB_POOL_MIN", "1"))
+    DB_POOL_MAX: int = int(os.getenv("DB_POOL_MAX", "10"))
+    # Tempo máximo (s) aguardando uma conexão livre quando o pool está cheio
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    # Conexões ociosas há mais que N segundos são testadas com SELECT 1
+    DB_POOL_HEALTHCHECK_IDLE: float = float(
+        os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30")
+    )
+    # Recicla conexões mais antigas que N segundos (0 desativa)
+    DB_POOL_MAX_LIFETIME: float = float(
+        os.getenv("DB_POOL_MAX_LIFETIME", "1800")
+    )
+    # Cache em memória (ver core/cache.py)
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", "2000"))
+    CACHE_MAX_BYTES: int = int(
+        os.getenv("CACHE_MAX_BYTES", str(128 * 1024 * 1024))
+    )
+    # Maior entrada admitida (0 = 1/8 de CACHE_MAX_BYTES)
+    CACHE_MAX_ITEM_BYTES: int = int(os.getenv("CACHE_MAX_ITEM_BYTES", "0"))
+    # Intervalo (s) da varredura de expirados em background
+    CACHE_SWEEP_INTERVAL: float = float(
+        os.getenv("CACHE_SWEEP_INTERVAL", "30")
+    )
+    # Recarga proativa: chaves com CACHE_HOT_HITS acessos desde a última
+    # carga são recarregadas antes de ficarem stale
+    CACHE_REFRESH_INTERVAL: float = float(
+        os.getenv("CACHE_REFRESH_INTERVAL", "15")
+    )
+    CACHE_HOT_HITS: int = int(os.getenv("CACHE_HOT_HITS", "3"))
+    # Soft TTL (serve e recarrega em background) e hard TTL (descarta)
+    QUERY_CACHE_TTL: int = int(os.getenv("QUERY_CACHE_TTL", "120"))
+    QUERY_CACHE_HARD_TTL: int = int(os.getenv("QUERY_CACHE_HARD_TTL", "900"))
+    DISTINCT_CACHE_TTL: int = int(os.getenv("DISTINCT_CACHE_TTL", "300"))
+    DISTINCT_CACHE_HARD_TTL: int = int(
+        os.getenv("DISTINCT_CACHE_HARD_TTL", "1800")
+    )
+    # Poll do watermark de sales (s); 0 desativa a invalidação precisa
+    WATERMARK_INTERVAL: float = float(os.getenv("WATERMARK_INTERVAL", "30"))
+    # TTL de consultas cujo período termina antes do último dia com dados
+    CACHE_CLOSED_TTL: int = int(os.getenv("CACHE_CLOSED_TTL", "21600"))
+    # Execução de /api/query e /api/distinct: "async" ou "sync"
+    QUERY_BACKEND: str = os.getenv("QUERY_BACKEND", "async").lower()
+    # Pool próprio do backend assíncrono (ver core/db_async.py)
+    DB_ASYNC_POOL_MIN: int = int(
+        os.getenv("DB_ASYNC_POOL_MIN", os.getenv("DB_POOL_MIN", "1"))
+    )
+    DB_ASYNC_POOL_MAX: int = int(
+        os.getenv("DB_ASYNC_POOL_MAX", os.getenv("DB_POOL_MAX", "10"))
+    )
+    # Prepared statements para /api/query e /api/distinct. Desligado por
+    # padrão: quebram atrás de pgbouncer em modo transaction
+    PREPARED_STATEMENTS: bool = os.getenv(
+        "PREPARED_STATEMENTS", "false"
+    ).lower() in ("1", "true", "yes")
+    # plan_cache_mode das sessões com prepared statements ligado. O padrão
+    # replaneja cada EXECUTE com os valores (economiza só o parse): um
+    # plano genérico ignoraria a seletividade do período e os índices
+    PREPARED_PLAN_CACHE_MODE: str = os.getenv(
+        "PREPARED_PLAN_CACHE_MODE", "force_custom_plan"
+    )
+    # Compressão das respostas (ver core/compression.py)
+    COMPRESSION_ENABLED: bool = os.getenv(
+        "COMPRESSION_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    # Corpos menores que isso (bytes) saem sem compressão
+    COMPRESSION_MIN_SIZE: int = int(
+        os.getenv("COMPRESSION_MIN_SIZE", "1024")
+    )
+    # Nível 1-9, usado por gzip, br e zstd
+    COMPRESSION_LEVEL: int = int(os.getenv("COMPRESSION_LEVEL", "6"))
+    # Orçamento do cache de corpos comprimidos (bytes)
+    COMPRESSION_CACHE_BYTES: int = int(
+        os.getenv("COMPRESSION_CACHE_BYTES", str(32 * 1024 * 1024))
+    )
+    # Linhas por fetchmany do cursor no servidor nas respostas em
+    # streaming de /api/query (memória por requisição fica constante)
+    STREAM_BATCH_SIZE: int = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+    # Controle de admissão por custo (ver core/costguard.py); só vale
+    # para roles com budget em model.yaml (roles.<role>.budget), que tem
+    # precedência sobre os padrões abaixo
+    COST_GUARD_ENABLED: bool = os.getenv(
+        "COST_GUARD_ENABLED", "true"
+    ).lower() in ("1", "true", "yes")
+    # Custo total e linhas estimados pelo planner no nó raiz
+    COST_GUARD_MAX_COST: float = float(
+        os.getenv("COST_GUARD_MAX_COST", "1000000")
+    )
+    COST_GUARD_MAX_ROWS: int = int(os.getenv("COST_GUARD_MAX_ROWS", "10000"))
+    # Acima do orçamento: "reject", "approximate" ou "queue"
+    COST_GUARD_POLICY: str = os.getenv("COST_GUARD_POLICY", "reject").lower()
+    # Percentual lido (TABLESAMPLE) quando a política é "approximate"
+    COST_GUARD_SAMPLE_PERCENT: float = float(
+        os.getenv("COST_GUARD_SAMPLE_PERCENT", "1")
+    )
+    # Consultas caras executando ao mesmo tempo na política "queue" e
+    # espera máxima (s) por uma vaga antes do 503
+    COST_GUARD_QUEUE_SLOTS: int = int(os.getenv("COST_GUARD_QUEUE_SLOTS", "2"))
+    COST_GUARD_QUEUE_TIMEOUT: float = float(
+        os.getenv("COST_GUARD_QUEUE_TIMEOUT", "30")
+    )
+    # Validade (s) das estimativas em cache (mudam com ANALYZE)
+    COST_GUARD_CACHE_TTL: int = int(os.getenv("COST_GUARD_CACHE_TTL", "600"))
+    # Tabelas de rollup do cube sales (ver core/rollups.py); exige criar
+    # as tabelas de db/rollups.sql antes de ligar
+    ROLLUPS_ENABLED: bool = os.getenv(
+        "ROLLUPS_ENABLED", "false"
+    ).lower() in ("1", "true", "yes")
+    # Recalcula os últimos N dias a cada intervalo (s), além dos avanços
+    # do watermark
+    ROLLUP_REFRESH_INTERVAL: float = float(
+        os.getenv("ROLLUP_REFRESH_INTERVAL", "300")
+    )
+    ROLLUP_REFRESH_DAYS: int = int(os.getenv("ROLLUP_REFRESH_DAYS", "3"))
+    # Recálculo completo (s) para alterações em vendas mais antigas que
+    # ROLLUP_REFRESH_DAYS; é o atraso máximo dos rollups (0 desativa)
+    ROLLUP_RECONCILE_INTERVAL: float = float(
+        os.getenv("ROLLUP_RECONCILE_INTERVAL", "86400")
+    )
+    # Materialized views de fatos (ver core/factviews.py); exige criar as
+    # views de db/views.sql antes de ligar
+    FACT_VIEWS_ENABLED: bool = os.getenv(
+        "FACT_VIEWS_ENABLED", "false"
+    ).lower() in ("1", "true", "yes")
+    FACT_VIEWS_REFRESH_INTERVAL: float = float(
+        os.getenv("FACT_VIEWS_REFRESH_INTERVAL", "600")
+    )
+    # Aquecimento do cache no startup (ver app/warmup.py)
+    WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() in (
+        "1", "true", "yes"
+    )
+    # Tempo máximo (s) com /ready respondendo "warming"
+    WARMUP_TIMEOUT: float = float(os.getenv("WARMUP_TIMEOUT", "60"))
+    # Consultas de aquecimento em paralelo (não deve esgotar o pool)
+    WARMUP_CONCURRENCY: int = int(os.getenv("WARMUP_CONCURRENCY", "3"))
+    # Fuso usado para resolver {today} etc. como o navegador dos usuários
+    WARMUP_TIMEZONE: str = os.getenv("WARMUP_TIMEZONE", "America/Sao_Paulo")
 
 
 settings = Settings()
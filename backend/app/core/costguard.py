@@ -0,0 +1,210 @@
+"""
+Controle de admissão de /api/query pelo custo estimado (EXPLAIN).
+
+- estimate() roda EXPLAIN (FORMAT JSON) no SQL compilado, sem executar,
+    e lê o custo total e as linhas estimadas do nó raiz do plano.
+- As estimativas ficam em cache (COST_GUARD_CACHE_TTL) pelo SQL do
+    formato compilado mais os parâmetros. Os valores dos filtros (o
+    período, sobretudo) mudam a seletividade: reusar o plano de um dia
+    para o histórico inteiro admitiria a consulta errada.
+- Ligado por COST_GUARD_ENABLED, só vale para as roles que optam por
+    um orçamento (model.yaml, roles.<role>.budget: max_cost, max_rows,
+    policy); o que faltar vem de COST_GUARD_*. Sem budget a ação é
+    sempre "run".
+- Acima do orçamento a política decide:
+    "reject" -> OverBudget (422 com a estimativa);
+    "approximate" -> a rota refaz a consulta em modo amostrado;
+    "queue" -> executa exata, com no máximo COST_GUARD_QUEUE_SLOTS ao
+    mesmo tempo; quem espera mais que COST_GUARD_QUEUE_TIMEOUT recebe
+    503 (QueueTimeout).
+- Amostrar não reduz o número de grupos: passar de max_rows com
+    "approximate" vira "reject".
+- stats() expõe estimativas, decisões e a fila para GET /api/metrics.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.cache import TTLCache, make_key
+from app.core.config import settings
+from app.core.db import PoolTimeout
+from app.core.executor import fetch_all
+
+POLICIES = ("reject", "approximate", "queue")
+
+Estimate = Dict[str, Any]
+
+
+class OverBudget(Exception):
+    """Consulta acima do orçamento da role (política reject)."""
+
+    def __init__(self, estimate: Estimate):
+        super().__init__(
+            "Consulta acima do orçamento de custo: estimativa "
+            f"{estimate['cost']:g} (máx. {estimate['max_cost']:g}), "
+            f"{estimate['rows']} linhas (máx. {estimate['max_rows']})"
+        )
+        self.estimate = estimate
+
+
+class QueueTimeout(PoolTimeout):
+    """Consulta cara não conseguiu vaga na fila a tempo."""
+
+
+explain_cache = TTLCache(max_entries=1000, max_bytes=4 * 1024 * 1024)
+
+_slots = asyncio.Semaphore(max(1, settings.COST_GUARD_QUEUE_SLOTS))
+_state: Dict[str, int] = {
+    "explains": 0,
+    "cached": 0,
+    "rejected": 0,
+    "approximated": 0,
+    "queued": 0,
+    "waiting": 0,
+    "queue_timeouts": 0,
+}
+
+
+def budget(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Orçamento efetivo: o da role sobre os padrões COST_GUARD_*."""
+    policy = str(
+        overrides.get("policy", settings.COST_GUARD_POLICY)
+    ).lower()
+    if policy not in POLICIES:
+        raise ValueError(f"Política de custo inválida: {policy}")
+    return {
+        "max_cost": float(
+            overrides.get("max_cost", settings.COST_GUARD_MAX_COST)
+        ),
+        "max_rows": int(
+            overrides.get("max_rows", settings.COST_GUARD_MAX_ROWS)
+        ),
+        "policy": policy,
+    }
+
+
+def _root(plan: Any) -> Dict[str, Any]:
+    # psycopg devolve o json já decodificado; por via das dúvidas, texto
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+async def estimate(sql: str, params: List[Any]) -> Dict[str, Any]:
+    """{"cost", "rows"} estimados pelo planner (em cache)."""
+    key = make_key("explain", sql, params)
+    found = explain_cache.get(key)
+    if found is not None:
+        _state["cached"] += 1
+        return found
+    rows = await fetch_all(
+        "EXPLAIN (FORMAT JSON) " + sql, params, prepare=False
+    )
+    root = _root(next(iter(rows[0].values())))
+    value = {
+        "cost": float(root["Total Cost"]),
+        "rows": int(root["Plan Rows"]),
+    }
+    _state["explains"] += 1
+    explain_cache.set(
+        key, value, ttl_seconds=settings.COST_GUARD_CACHE_TTL, cost=256
+    )
+    return value
+
+
+def decide(cost: float, rows: int, limits: Dict[str, Any]) -> str:
+    """"run" dentro do orçamento; senão a ação da política."""
+    over_cost = cost > limits["max_cost"]
+    over_rows = rows > limits["max_rows"]
+    if not (over_cost or over_rows):
+        return "run"
+    if limits["policy"] == "approximate" and over_rows:
+        return "reject"
+    return limits["policy"]
+
+
+def guarded(overrides: Optional[Dict[str, Any]]) -> bool:
+    """Se o controle vale para a role (ligado e com budget)."""
+    return settings.COST_GUARD_ENABLED and overrides is not None
+
+
+def namespace(base: str, overrides: Optional[Dict[str, Any]]) -> str:
+    """Namespace da chave de cache de um resultado sob orçamento.
+
+    O load (singleflight, SWR) aplica o orçamento de quem o disparou:
+    roles com orçamentos diferentes não podem dividir a entrada (uma
+    amostra ou um 422 de uma vazaria para a outra). Sem controle, a
+    chave é a de sempre e roles com o mesmo SQL continuam dividindo.
+    """
+    if not guarded(overrides):
+        return base
+    limits = budget(overrides or {})
+    return (
+        f"{base}@{limits['policy']}:{limits['max_cost']:g}:"
+        f"{limits['max_rows']}"
+    )
+
+
+async def check(
+    sql: str, params: List[Any], overrides: Optional[Dict[str, Any]]
+) -> Estimate:
+    """Estimativa, orçamento e ação ("run"|"reject"|"approximate"|"queue").
+
+    overrides é o budget da role (None = sem budget: ação "run").
+    Não levanta OverBudget: quem chama decide como aplicar a ação.
+    """
+    limits = budget(overrides or {})
+    found = await estimate(sql, params)
+    action = "run"
+    if guarded(overrides):
+        action = decide(found["cost"], found["rows"], limits)
+    return {**found, **limits, "action": action}
+
+
+def record(action: str) -> None:
+    """Conta uma decisão aplicada pela rota ("reject"/"approximate")."""
+    _state["rejected" if action == "reject" else "approximated"] += 1
+
+
+async def acquire(found: Optional[Estimate]) -> bool:
+    """Espera vaga se a ação é "queue"; False se não precisou de vaga."""
+    if found is None or found["action"] != "queue":
+        return False
+    _state["queued"] += 1
+    _state["waiting"] += 1
+    try:
+        await asyncio.wait_for(
+            _slots.acquire(), timeout=settings.COST_GUARD_QUEUE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        _state["queue_timeouts"] += 1
+        raise QueueTimeout(
+            "Fila de consultas caras cheia; tente novamente em instantes"
+        )
+    finally:
+        _state["waiting"] -= 1
+    return True
+
+
+def release() -> None:
+    _slots.release()
+
+
+@asynccontextmanager
+async def slot(found: Optional[Estimate]) -> AsyncIterator[None]:
+    queued = await acquire(found)
+    try:
+        yield
+    finally:
+        if queued:
+            release()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.COST_GUARD_ENABLED,
+        **budget({}),
+        **_state,
+        "cache_entries": explain_cache.stats().get("entries"),
+    }
@@ -0,0 +1,378 @@
+"""
+Pool de conexões PostgreSQL compartilhado por todas as rotas.
+
+- Mantém entre DB_POOL_MIN e DB_POOL_MAX conexões psycopg2 abertas,
+    evitando o custo de TCP/TLS e fork do backend a cada requisição.
+- statement_timeout é aplicado uma única vez, ao abrir cada sessão.
+- Health check no checkout: conexões fechadas são descartadas e as
+    ociosas há mais de DB_POOL_HEALTHCHECK_IDLE segundos são testadas
+    com SELECT 1; conexões antigas (DB_POOL_MAX_LIFETIME) são recicladas.
+- Com o pool cheio, o checkout aguarda até DB_POOL_TIMEOUT segundos e
+    então levanta PoolTimeout (respondido como 503 em main.py).
+- stats() expõe métricas de saturação para GET /api/metrics.
+
+As conexões ficam em autocommit: as consultas analíticas são somente
+leitura e assim nunca deixam sessões "idle in transaction" no servidor.
+
+fetch_all(..., prepare=True) usa prepared statements por conexão
+(PREPARE na primeira vez, EXECUTE depois): o Postgres pula parse e
+planejamento dos formatos repetidos de dashboard. Cada conexão guarda
+até _PREPARED_MAX statements (LRU, com DEALLOCATE do mais antigo).
+Desligado por padrão (PREPARED_STATEMENTS); ligado, as sessões usam
+PREPARED_PLAN_CACHE_MODE (force_custom_plan: replaneja com os valores).
+
+iter_batches lê por um cursor nomeado (no servidor) com fetchmany, numa
+transação própria: só um lote fica em memória por vez.
+"""
+import hashlib
+import itertools
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+from app.core.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro de DB_POOL_TIMEOUT."""
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        dsn: str,
+        minconn: int,
+        maxconn: int,
+        timeout: float,
+        healthcheck_idle: float,
+        max_lifetime: float,
+        statement_timeout: str,
+        plan_cache_mode: str = "",
+    ):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.max_lifetime = max_lifetime
+        self.statement_timeout = statement_timeout
+        self.plan_cache_mode = plan_cache_mode
+
+        self._cond = threading.Condition()
+        self._idle: Deque[_Slot] = deque()
+        # conexões abertas ou sendo abertas (ociosas + em uso)
+        self._opened = 0
+        self._waiting = 0
+
+        # métricas acumuladas
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._in_use_max = 0
+
+    # -- ciclo de vida da conexão -------------------------------------
+
+    def _connect(self) -> _Slot:
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            # Proteção contra consultas longas (uma vez por sessão)
+            cur.execute(
+                "SET statement_timeout TO %s",
+                (self.statement_timeout,),
+            )
+            if self.plan_cache_mode:
+                cur.execute(
+                    "SET plan_cache_mode TO %s", (self.plan_cache_mode,)
+                )
+        return _Slot(conn)
+
+    def _healthy(self, slot: _Slot) -> bool:
+        if slot.conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - slot.created_at > self.max_lifetime:
+            return False
+        if now - slot.last_used > self.healthcheck_idle:
+            try:
+                with slot.conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            except psycopg2.Error:
+                return False
+        return True
+
+    @staticmethod
+    def _close_quietly(slot: _Slot) -> None:
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+
+    def open(self) -> None:
+        """Pré-abre DB_POOL_MIN conexões (falhas são apenas logadas)."""
+        for _ in range(self.minconn):
+            with self._cond:
+                if self._opened >= self.minconn:
+                    return
+                self._opened += 1
+            try:
+                slot = self._connect()
+            except Exception as e:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                logger.warning("Pool: falha ao pré-abrir conexão: %s", e)
+                return
+            with self._cond:
+                self._idle.append(slot)
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Fecha as conexões ociosas (as em uso fecham ao retornar)."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._opened -= len(idle)
+            self._cond.notify_all()
+        for slot in idle:
+            self._close_quietly(slot)
+
+    # -- checkout / checkin -------------------------------------------
+
+    def _acquire(self) -> _Slot:
+        start = time.monotonic()
+        deadline = start + self.timeout
+        slot: Optional[_Slot] = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO: reutiliza a conexão mais "quente"
+                    slot = self._idle.pop()
+                    break
+                if self._opened < self.maxconn:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        "Pool de conexões esgotado "
+                        f"(máx. {self.maxconn}; espera de {self.timeout:g}s)"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            in_use = self._opened - len(self._idle)
+            self._in_use_max = max(self._in_use_max, in_use)
+
+        # Fora do lock: validação e abertura de conexões podem ser lentas
+        if slot is not None:
+            if self._healthy(slot):
+                return slot
+            self._close_quietly(slot)
+            with self._cond:
+                self._discarded += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, slot: _Slot, broken: bool = False) -> None:
+        conn = slot.conn
+        if not broken and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if not conn.autocommit:
+                    conn.autocommit = True
+            except psycopg2.Error:
+                broken = True
+        if broken or conn.closed:
+            self._close_quietly(slot)
+            with self._cond:
+                self._opened -= 1
+                self._discarded += 1
+                self._cond.notify()
+            return
+        slot.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Empresta uma conexão do pool (devolvida ao sair do bloco)."""
+        slot = self._acquire()
+        broken = False
+        try:
+            yield slot.conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._release(slot, broken)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            idle = len(self._idle)
+            in_use = self._opened - idle
+            checkouts = self._checkouts
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "open": self._opened,
+                "in_use": in_use,
+                "idle": idle,
+                "waiting": self._waiting,
+                "saturation": round(in_use / self.maxconn, 3),
+                "in_use_max": self._in_use_max,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_avg_ms": round(
+                    1000 * self._wait_total / checkouts, 3
+                ) if checkouts else 0.0,
+                "wait_max_ms": round(1000 * self._wait_max, 3),
+            }
+
+
+pool = ConnectionPool(
+    dsn=settings.DATABASE_URL,
+    minconn=settings.DB_POOL_MIN,
+    maxconn=settings.DB_POOL_MAX,
+    timeout=settings.DB_POOL_TIMEOUT,
+    healthcheck_idle=settings.DB_POOL_HEALTHCHECK_IDLE,
+    max_lifetime=settings.DB_POOL_MAX_LIFETIME,
+    statement_timeout=settings.STATEMENT_TIMEOUT,
+    plan_cache_mode=(
+        settings.PREPARED_PLAN_CACHE_MODE
+        if settings.PREPARED_STATEMENTS else ""
+    ),
+)
+
+
+_PREPARED_MAX = 256
+_prepared_lock = threading.Lock()
+# conexão -> nomes dos statements preparados nela (ordem de uso)
+_prepared: "weakref.WeakKeyDictionary[Any, OrderedDict]" = (
+    weakref.WeakKeyDictionary()
+)
+# contadores de /api/metrics; atualizados de várias threads do
+# threadpool, sempre sob _prepared_lock
+_prepared_stats = {"prepares": 0, "executes": 0}
+
+
+def _count(stat: str) -> None:
+    with _prepared_lock:
+        _prepared_stats[stat] += 1
+
+
+def _to_positional(sql: str) -> str:
+    # %s do psycopg2 -> $1, $2... do PREPARE
+    parts = sql.split("%s")
+    out = parts[0]
+    for i, part in enumerate(parts[1:], start=1):
+        out += f"${i}{part}"
+    return out.replace("%%", "%")
+
+
+def _execute_prepared(conn, cur, sql: str, params: Optional[list]) -> None:
+    name = "q_" + hashlib.sha1(sql.encode("utf-8")).hexdigest()[:24]
+    with _prepared_lock:
+        names = _prepared.setdefault(conn, OrderedDict())
+    if name in names:
+        names.move_to_end(name)
+    else:
+        if len(names) >= _PREPARED_MAX:
+            oldest, _ = names.popitem(last=False)
+            cur.execute(f"DEALLOCATE {oldest}")
+        cur.execute(f"PREPARE {name} AS {_to_positional(sql)}")
+        names[name] = None
+        _count("prepares")
+    args = "(" + ", ".join(["%s"] * len(params)) + ")" if params else ""
+    try:
+        cur.execute(f"EXECUTE {name}{args}", params or None)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # sessão perdeu os statements (ex.: DISCARD ALL): prepara de novo
+        names.clear()
+        _execute_prepared(conn, cur, sql, params)
+        return
+    _count("executes")
+
+
+def prepared_stats() -> Dict[str, Any]:
+    with _prepared_lock:
+        return dict(_prepared_stats)
+
+
+def fetch_all(
+    sql: str, params: Optional[list] = None, prepare: bool = False
+) -> List[Any]:
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if prepare:
+                _execute_prepared(conn, cur, sql, params)
+            else:
+                cur.execute(sql, params)
+            return cur.fetchall()
+
+
+_cursor_ids = itertools.count(1)
+
+
+def iter_batches(
+    sql: str, params: Optional[list], batch_size: int
+) -> Iterator[List[Any]]:
+    """Lotes de até batch_size linhas de um cursor no servidor."""
+    with pool.connection() as conn:
+        # cursores nomeados exigem transação; o pool faz o rollback e
+        # volta ao autocommit na devolução, mesmo se o gerador for fechado
+        conn.autocommit = False
+        name = f"stream_{next(_cursor_ids)}"
+        with conn.cursor(name, cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield rows
+
+
+def fetch_one(sql: str, params: Optional[tuple] = None) -> Any:
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, params)
+            return cur.fetchone() or {}
@@ -0,0 +1,186 @@
+"""
+Backend assíncrono de execução (psycopg 3 + AsyncConnectionPool).
+
+- Usado por /api/query e /api/distinct quando QUERY_BACKEND=async,
+    liberando o threadpool do FastAPI para /health e rotas leves.
+- Pool próprio (DB_ASYNC_POOL_MIN/MAX), com health check no checkout e
+    statement_timeout aplicado uma vez por sessão (callback configure).
+- Cancelamento real: se o cliente desconectar ou o timeout estourar,
+    enviamos um cancel ao servidor (a consulta para no Postgres) e
+    devolvemos a conexão ao pool pronta para reuso.
+
+O SQL do translator usa placeholders %s, compatíveis com o psycopg 3.
+Com prepare=True o psycopg 3 prepara o statement no servidor na primeira
+execução em cada conexão (até PREPARED_MAX por conexão), com o
+plan_cache_mode de PREPARED_PLAN_CACHE_MODE.
+
+iter_batches lê por um cursor no servidor (DECLARE/FETCH) em lotes,
+para as respostas em streaming.
+"""
+import asyncio
+import itertools
+import re
+from typing import Any, AsyncIterator, List, Optional
+
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from psycopg_pool import PoolTimeout as AsyncPoolTimeout
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.db import PoolTimeout
+
+
+class QueryTimeout(Exception):
+    """A consulta excedeu o tempo limite e foi cancelada no servidor."""
+
+
+class ClientDisconnected(Exception):
+    """O cliente desconectou; a consulta foi cancelada no servidor."""
+
+
+_PG_UNITS = {"ms": 0.001, "s": 1, "min": 60, "h": 3600, "d": 86400}
+
+
+def parse_pg_interval(value: str) -> float:
+    """Converte valores como "15s", "5min" ou "1500" (ms) em segundos."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(ms|s|min|h|d)?\s*", value or "")
+    if not m:
+        raise ValueError(f"Intervalo inválido: {value!r}")
+    return float(m.group(1)) * _PG_UNITS[m.group(2) or "ms"]
+
+
+PREPARED_MAX = 256
+
+
+async def _configure(conn: AsyncConnection) -> None:
+    await conn.set_autocommit(True)
+    conn.prepared_max = PREPARED_MAX
+    async with conn.cursor() as cur:
+        # SET não aceita parâmetros no protocolo estendido: usa set_config
+        await cur.execute(
+            "SELECT set_config('statement_timeout', %s, false)",
+            (settings.STATEMENT_TIMEOUT,),
+        )
+        if settings.PREPARED_STATEMENTS and settings.PREPARED_PLAN_CACHE_MODE:
+            await cur.execute(
+                "SELECT set_config('plan_cache_mode', %s, false)",
+                (settings.PREPARED_PLAN_CACHE_MODE,),
+            )
+
+
+apool = AsyncConnectionPool(
+    settings.DATABASE_URL,
+    min_size=settings.DB_ASYNC_POOL_MIN,
+    max_size=settings.DB_ASYNC_POOL_MAX,
+    timeout=settings.DB_POOL_TIMEOUT,
+    max_lifetime=settings.DB_POOL_MAX_LIFETIME or 3600.0,
+    check=AsyncConnectionPool.check_connection,
+    configure=_configure,
+    kwargs={"row_factory": dict_row},
+    open=False,
+    name="query-async",
+)
+
+# Tempo máximo do lado do cliente; o servidor também aplica
+# statement_timeout, este é o limite para cancelar sem depender dele.
+QUERY_TIMEOUT = parse_pg_interval(settings.STATEMENT_TIMEOUT)
+
+
+async def _execute(
+    conn: AsyncConnection, sql: str, params: Optional[list], prepare: bool
+):
+    async with conn.cursor() as cur:
+        await cur.execute(sql, params, prepare=prepare)
+        return await cur.fetchall()
+
+
+async def _wait_disconnect(request: Request) -> None:
+    # Com o corpo já consumido, receive() só retorna no disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel(conn: AsyncConnection, task: "asyncio.Task") -> None:
+    try:
+        await conn.cancel_safe(timeout=5.0)
+    except Exception:
+        pass
+    try:
+        await task
+    except BaseException:
+        # QueryCanceled esperado após o cancel no servidor
+        pass
+
+
+async def fetch_all(
+    sql: str,
+    params: Optional[list] = None,
+    request: Optional[Request] = None,
+    timeout: Optional[float] = None,
+    prepare: bool = False,
+) -> List[Any]:
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    try:
+        async with apool.connection() as conn:
+            query = asyncio.ensure_future(
+                _execute(conn, sql, params, prepare)
+            )
+            watchers = {query}
+            disconnect = None
+            if request is not None:
+                disconnect = asyncio.ensure_future(_wait_disconnect(request))
+                watchers.add(disconnect)
+            try:
+                done, _ = await asyncio.wait(
+                    watchers,
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            except asyncio.CancelledError:
+                await _cancel(conn, query)
+                raise
+            finally:
+                if disconnect is not None:
+                    disconnect.cancel()
+            if query in done:
+                return query.result()
+            await _cancel(conn, query)
+            if disconnect is not None and disconnect in done:
+                raise ClientDisconnected()
+            raise QueryTimeout(
+                f"Consulta excedeu o tempo limite ({timeout:g}s)"
+            )
+    except AsyncPoolTimeout as e:
+        raise PoolTimeout(str(e)) from e
+
+
+_cursor_ids = itertools.count(1)
+
+
+async def iter_batches(
+    sql: str, params: Optional[list], batch_size: int
+) -> AsyncIterator[List[Any]]:
+    """Lotes de até batch_size linhas de um cursor no servidor.
+
+    O statement_timeout da sessão vale para cada FETCH. Se quem consome
+    parar (ex.: cliente desconectou), o cursor e a transação são
+    fechados e a conexão volta ao pool.
+    """
+    try:
+        async with apool.connection() as conn:
+            # em autocommit o cursor no servidor precisa de uma transação
+            async with conn.transaction():
+                name = f"stream_{next(_cursor_ids)}"
+                async with conn.cursor(name=name) as cur:
+                    await cur.execute(sql, params)
+                    while True:
+                        rows = await cur.fetchmany(batch_size)
+                        if not rows:
+                            return
+                        yield rows
+    except AsyncPoolTimeout as e:
+        raise PoolTimeout(str(e)) from e
@@ -0,0 +1,272 @@
+"""
+Derivação de consultas a partir de resultados mais finos já em cache.
+
+- Cada resultado completo de /api/query (menos linhas que o limit) é
+    registrado com seu formato: cubo, conjunto filtrado
+    (translator.where_signature), dimensões, granularidade e medidas.
+- Num miss, procuramos um resultado registrado com o mesmo conjunto
+    filtrado e agrupamento mais fino (superconjunto das dimensões e
+    granularidade de tempo igual ou menor: hour < day < month).
+- Medidas aditivas são somadas em processo e razões (ex.:
+    sales.ticket_medio) são recalculadas a partir de soma e contagem
+    (translator.MEASURE_ROLLUP), sem ir ao banco. A divisão de Decimal
+    usa a escala e o arredondamento do numeric do Postgres (_pg_div):
+    derivado ou executado, o valor (e o ETag) é o mesmo.
+- Só derivamos de resultados carregados há menos de QUERY_CACHE_TTL e
+    apenas em requisições do cliente: recargas em background vão ao
+    banco, evitando que entradas derivadas se realimentem.
+- Ordenação por dimensões de texto fica no banco (a collation do
+    Postgres difere da ordenação do Python).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal, localcontext
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.cache import ttl_cache
+from app.core.config import settings
+from app.domain.translator import MEASURE_ROLLUP, TIME_GRAINS, where_signature
+
+# Quantos formatos guardamos por conjunto filtrado
+_MAX_PER_GROUP = 32
+
+
+class Shape:
+    """Formato de uma consulta canônica (ver translator.canonicalize)."""
+
+    __slots__ = (
+        "cube", "where", "dims", "grain", "measures", "order", "limit"
+    )
+
+    def __init__(
+        self,
+        cube: str,
+        filters: List[Dict[str, Any]],
+        dimensions: List[str],
+        measures: List[str],
+        granularity: Optional[str],
+        order: List[Dict[str, str]],
+        limit: int,
+    ):
+        self.cube = cube
+        self.where = where_signature(cube, filters, granularity)
+        self.dims = tuple(d for d in dimensions if d != "time.date")
+        self.grain = (
+            (granularity or "day") if "time.date" in dimensions else None
+        )
+        self.measures = tuple(measures)
+        self.order = order
+        self.limit = max(1, min(limit, 10000))
+
+    @property
+    def columns(self) -> List[str]:
+        dims = list(self.dims)
+        if self.grain is not None:
+            dims = sorted(dims + ["time.date"])
+        return dims + list(self.measures)
+
+    def same_grouping(self, other: "Shape") -> bool:
+        return set(self.dims) == set(other.dims) and self.grain == other.grain
+
+    def covers(self, other: "Shape") -> bool:
+        """True se other pode ser calculado a partir deste resultado."""
+        if not set(other.dims) <= set(self.dims):
+            return False
+        if other.grain is not None:
+            if self.grain is None:
+                return False
+            if TIME_GRAINS.index(self.grain) > TIME_GRAINS.index(other.grain):
+                return False
+        same = self.same_grouping(other)
+        for m in other.measures:
+            if same and m in self.measures:
+                continue
+            rule = MEASURE_ROLLUP.get(m)
+            if rule is None:
+                return False
+            needed = rule[1:] if rule[0] == "ratio" else (m,)
+            if not all(n in self.measures for n in needed):
+                return False
+        return True
+
+
+def _coarsen(grain: Optional[str]) -> Callable[[Any], Any]:
+    # DATE(...) devolve date; DATE_TRUNC(...) devolve datetime
+    if grain == "day":
+        return lambda v: v.date() if isinstance(v, datetime) else v
+    if grain == "month":
+        return lambda v: (
+            datetime(v.year, v.month, 1) if v is not None else None
+        )
+    return lambda v: v
+
+
+def _nbase(x: Decimal) -> Tuple[int, int]:
+    """(weight, primeiro dígito) de x na base 10000 do numeric."""
+    x = abs(x)
+    if not x:
+        return 0, 0
+    weight = x.adjusted() // 4
+    return weight, int(x.scaleb(-4 * weight))
+
+
+def _pg_div(num: Any, den: Any) -> Any:
+    """num / den como o Postgres divide numeric (select_div_scale)."""
+    if not isinstance(num, Decimal):
+        return num / den
+    den = Decimal(den)
+    (w1, d1), (w2, d2) = _nbase(num), _nbase(den)
+    qweight = w1 - w2 - (1 if d1 <= d2 else 0)
+    # 16 dígitos significativos, no mínimo a escala das entradas
+    scale = max(
+        16 - 4 * qweight,
+        -num.as_tuple().exponent,
+        -den.as_tuple().exponent,
+        0,
+    )
+    scale = min(scale, 1000)
+    with localcontext() as ctx:
+        ctx.prec = scale + max(num.adjusted(), 0) + 40
+        return (num / den).quantize(
+            Decimal(1).scaleb(-scale), rounding=ROUND_HALF_UP
+        )
+
+
+def _add(acc: Any, value: Any) -> Any:
+    # SUM ignora NULL; o resultado só é NULL se todos forem NULL
+    if value is None:
+        return acc
+    return value if acc is None else acc + value
+
+
+def _sort(rows: List[Dict[str, Any]], order: List[Dict[str, str]]) -> None:
+    # Postgres: NULLS LAST em asc e NULLS FIRST em desc
+    for o in reversed(order):
+        by = o.get("by")
+        rows.sort(
+            key=lambda r: (r[by] is None, r[by] if r[by] is not None else 0),
+            reverse=o.get("dir", "desc").lower() == "desc",
+        )
+
+
+def rollup(
+    rows: List[Dict[str, Any]], source: Shape, target: Shape
+) -> List[Dict[str, Any]]:
+    """Reagrega as linhas de source no formato de target."""
+    columns = target.columns
+    if target.same_grouping(source) and all(
+        m in source.measures for m in target.measures
+    ):
+        out = [{c: r[c] for c in columns} for r in rows]
+    else:
+        additive: List[str] = []
+        for m in target.measures:
+            rule = MEASURE_ROLLUP[m]
+            for n in (rule[1:] if rule[0] == "ratio" else (m,)):
+                if n not in additive:
+                    additive.append(n)
+        coarsen = _coarsen(target.grain)
+        groups: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+        for r in rows:
+            key = tuple(r[d] for d in target.dims)
+            if target.grain is not None:
+                key += (coarsen(r["time.date"]),)
+            acc = groups.get(key)
+            if acc is None:
+                acc = groups[key] = dict.fromkeys(additive)
+            for n in additive:
+                acc[n] = _add(acc[n], r[n])
+        if not groups and not target.dims and target.grain is None:
+            # sem GROUP BY o banco sempre devolve uma linha
+            groups[()] = {
+                n: (0 if MEASURE_ROLLUP[n][0] == "count" else None)
+                for n in additive
+            }
+        out = []
+        for key, acc in groups.items():
+            row = dict(zip(target.dims, key))
+            if target.grain is not None:
+                row["time.date"] = key[-1]
+            for m in target.measures:
+                rule = MEASURE_ROLLUP[m]
+                if rule[0] == "ratio":
+                    num, den = acc[rule[1]], acc[rule[2]]
+                    row[m] = (
+                        _pg_div(num, den)
+                        if num is not None and den else None
+                    )
+                else:
+                    row[m] = acc[m]
+            out.append({c: row[c] for c in columns})
+    _sort(out, target.order)
+    return out[: target.limit]
+
+
+class DeriveIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[Tuple[str, ...], "OrderedDict[str, Any]"] = {}
+        self._derived = 0
+
+    def register(
+        self,
+        key: str,
+        shape: Shape,
+        rows: List[Any],
+        as_of: Optional[float] = None,
+    ) -> None:
+        if len(rows) >= shape.limit:
+            # truncado pelo limit: não serve de base para reagregação
+            return
+        with self._lock:
+            group = self._groups.setdefault(shape.where, OrderedDict())
+            group[key] = (shape, as_of or time.time())
+            group.move_to_end(key)
+            while len(group) > _MAX_PER_GROUP:
+                group.popitem(last=False)
+
+    @staticmethod
+    def _orderable(shape: Shape) -> bool:
+        return all(
+            o.get("by") in shape.measures or o.get("by") == "time.date"
+            for o in shape.order
+        )
+
+    def derive(
+        self, key: str, shape: Shape
+    ) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """Retorna (linhas, as_of) derivadas de um resultado em cache."""
+        if not self._orderable(shape):
+            return None
+        min_as_of = time.time() - settings.QUERY_CACHE_TTL
+        with self._lock:
+            candidates = list(self._groups.get(shape.where, {}).items())
+        best = None
+        for cand_key, (cand, as_of) in candidates:
+            if cand_key == key or as_of < min_as_of:
+                continue
+            if cand.cube != shape.cube or not cand.covers(shape):
+                continue
+            value = ttl_cache.peek(cand_key)
+            if value is None:
+                with self._lock:
+                    self._groups.get(shape.where, {}).pop(cand_key, None)
+                continue
+            if best is None or len(value["rows"]) < len(best[1]["rows"]):
+                best = (cand, value, as_of)
+        if best is None:
+            return None
+        cand, value, as_of = best
+        rows = rollup(value["rows"], cand, shape)
+        self._derived += 1
+        return rows, as_of
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            shapes = sum(len(g) for g in self._groups.values())
+        return {"derived": self._derived, "shapes": shapes}
+
+
+derive_index = DeriveIndex()
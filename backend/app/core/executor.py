@@ -0,0 +1,84 @@
+"""
+Execução das consultas analíticas conforme QUERY_BACKEND.
+
+- "async": psycopg 3 com pool próprio e cancelamento real quando o
+    cliente desconecta ou o timeout estoura (core/db_async.py).
+- "sync": psycopg2 via pool compartilhado (core/db.py), rodando no
+    threadpool do FastAPI — mantido para comparação sob carga.
+
+O SQL vem do translator, com poucos formatos repetidos: com
+PREPARED_STATEMENTS ligado (desligado por padrão; incompatível com
+pgbouncer em modo transaction), os dois backends usam prepared
+statements.
+
+iter_batches lê em lotes por um cursor no servidor (respostas em
+streaming); no backend sync cada lote é buscado no threadpool.
+"""
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+from app.core import db, db_async
+from app.core.config import settings
+
+
+def is_async() -> bool:
+    return settings.QUERY_BACKEND == "async"
+
+
+async def fetch_all(
+    sql: str,
+    params: Optional[list] = None,
+    request: Optional[Request] = None,
+    prepare: Optional[bool] = None,
+) -> List[Any]:
+    # EXPLAIN não pode ser preparado: quem o envia passa prepare=False
+    if prepare is None:
+        prepare = settings.PREPARED_STATEMENTS
+    if is_async():
+        return await db_async.fetch_all(
+            sql, params, request=request, prepare=prepare
+        )
+    return await run_in_threadpool(db.fetch_all, sql, params, prepare)
+
+
+async def _iterate_in_threadpool(
+    batches: Iterator[List[Any]],
+) -> AsyncIterator[List[Any]]:
+    try:
+        while True:
+            rows = await run_in_threadpool(next, batches, None)
+            if rows is None:
+                return
+            yield rows
+    finally:
+        # devolve a conexão ao pool já, mesmo se o consumo parar no meio
+        await run_in_threadpool(batches.close)
+
+
+def iter_batches(
+    sql: str, params: Optional[list] = None, batch_size: int = 500
+) -> AsyncIterator[List[Any]]:
+    if is_async():
+        return db_async.iter_batches(sql, params, batch_size)
+    return _iterate_in_threadpool(db.iter_batches(sql, params, batch_size))
+
+
+async def open_pools() -> None:
+    await run_in_threadpool(db.pool.open)
+    if is_async():
+        await db_async.apool.open(wait=False)
+
+
+async def close_pools() -> None:
+    if is_async():
+        await db_async.apool.close()
+    await run_in_threadpool(db.pool.close)
+
+
+def pool_stats() -> dict:
+    stats = {"pool": db.pool.stats()}
+    if is_async():
+        stats["async_pool"] = db_async.apool.get_stats()
+    return stats
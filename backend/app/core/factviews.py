@@ -0,0 +1,89 @@
+"""
+Atualização das materialized views de fatos (db/views.sql).
+
+- mv_fact_sales e mv_fact_product_sales trazem os fatos já com nomes de
+    loja, canal e produto; o translator lê delas em vez de refazer os
+    joins product_sales -> sales -> stores -> channels.
+- A tarefa "fact-views-refresh" roda REFRESH MATERIALIZED VIEW
+    CONCURRENTLY a cada FACT_VIEWS_REFRESH_INTERVAL: as consultas
+    continuam lendo a versão anterior durante a atualização. Uma view
+    ainda não populada recebe o REFRESH comum.
+- Depois de cada atualização guardamos até que dia a view está completa
+    (dias anteriores ao MAX(created_at) dela). Só consultas cujo período
+    termina antes disso são roteadas (covers); as que chegam ao dia
+    corrente continuam nas tabelas base, sem perder vendas recentes.
+"""
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, Optional
+
+from app.core import tasks
+from app.core.config import settings
+from app.core.db import pool
+
+VIEWS = ("mv_fact_sales", "mv_fact_product_sales")
+
+_lock = threading.Lock()
+# view -> primeiro dia não coberto (dias < este estão completos)
+_covered_until: Dict[str, date] = {}
+_state: Dict[str, Any] = {"refreshes": 0, "errors": 0, "last_seconds": None}
+
+
+def _refresh_view(cur, view: str) -> Optional[date]:
+    cur.execute(
+        "SELECT ispopulated FROM pg_matviews WHERE matviewname = %s",
+        (view,),
+    )
+    row = cur.fetchone()
+    concurrently = "CONCURRENTLY " if row and row[0] else ""
+    cur.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{view}")
+    cur.execute(f"SELECT MAX(created_at) FROM {view}")
+    last = cur.fetchone()[0]
+    return last.date() if last is not None else None
+
+
+def refresh() -> None:
+    started = time.monotonic()
+    with _lock, pool.connection() as conn:
+        conn.autocommit = False
+        try:
+            # uma transação por view: cada uma fica visível ao terminar
+            for view in VIEWS:
+                with conn.cursor() as cur:
+                    # atualização completa pode passar do statement_timeout
+                    cur.execute("SET LOCAL statement_timeout = 0")
+                    until = _refresh_view(cur, view)
+                conn.commit()
+                if until is not None:
+                    _covered_until[view] = until
+        except Exception:
+            conn.rollback()
+            _state["errors"] += 1
+            raise
+    _state["refreshes"] += 1
+    _state["last_seconds"] = round(time.monotonic() - started, 3)
+
+
+def covers(view: str, hi: Optional[date]) -> bool:
+    """True se a view tem todos os dados de um período que termina em hi."""
+    if not settings.FACT_VIEWS_ENABLED or hi is None:
+        return False
+    until = _covered_until.get(view)
+    return until is not None and hi < until
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "enabled": settings.FACT_VIEWS_ENABLED,
+        **_state,
+        "covered_until": {
+            v: d.isoformat() for v, d in _covered_until.items()
+        },
+    }
+
+
+if settings.FACT_VIEWS_ENABLED:
+    tasks.register(
+        "fact-views-refresh", settings.FACT_VIEWS_REFRESH_INTERVAL, refresh
+    )
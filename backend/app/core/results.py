@@ -0,0 +1,134 @@
+"""
+Camada de resultados: cache + single-flight + stale-while-revalidate.
+
+- get_or_load(key, loader, ttl, hard_ttl) é o caminho usado pelas rotas
+    de consulta: hit fresco responde direto; hit stale (após o soft TTL)
+    responde na hora e agenda um recarregamento em background; miss
+    executa uma única vez por chave (core/singleflight.py).
+- O hard TTL limita quanto tempo um resultado stale pode ser servido.
+- Chaves "quentes" (CACHE_HOT_HITS acessos desde a última carga) são
+    recarregadas proativamente pela tarefa "cache-refresh" antes de
+    ficarem stale, para que ninguém pague a latência da consulta fria.
+- scope é o intervalo de datas lido pela consulta: o watermark
+    (core/watermark.py) só invalida entradas que se sobrepõem aos dias
+    alterados, e períodos fechados ficam em cache por CACHE_CLOSED_TTL.
+
+O loader recebe a Request (ou None em recargas de background) e devolve
+o valor a ser cacheado. cost(valor), se informado, dá o tamanho em bytes
+contado no orçamento do cache (ex.: len do JSON já serializado); sem ele
+o cache estima pelo objeto.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from starlette.requests import Request
+
+from app.core import tasks
+from app.core.cache import Scope, ttl_cache
+from app.core.config import settings
+from app.core.singleflight import single_flight
+from app.core.watermark import watermark
+
+logger = logging.getLogger("uvicorn.error")
+
+Loader = Callable[[Optional[Request]], Awaitable[Any]]
+Cost = Optional[Callable[[Any], int]]
+
+_background: Set[asyncio.Task] = set()
+_stats = {"refreshes": 0, "refresh_errors": 0}
+
+
+async def _load_and_store(
+    key: str,
+    loader: Loader,
+    ttl: int,
+    hard_ttl: int,
+    scope: Optional[Scope],
+    request: Optional[Request],
+    cost: Cost = None,
+) -> Any:
+    value = await loader(request)
+    store_ttl, store_hard_ttl = ttl, hard_ttl
+    if scope is not None and watermark.is_closed(scope[1]):
+        # período fechado: só muda se o watermark invalidar
+        store_ttl = store_hard_ttl = settings.CACHE_CLOSED_TTL
+    ttl_cache.set(
+        key,
+        value,
+        ttl_seconds=max(store_ttl, store_hard_ttl),
+        cost=cost(value) if cost is not None else None,
+        soft_ttl_seconds=store_ttl,
+        loader=lambda: _refresh(key, loader, ttl, hard_ttl, scope, cost),
+        scope=scope,
+    )
+    return value
+
+
+async def _refresh(
+    key: str,
+    loader: Loader,
+    ttl: int,
+    hard_ttl: int,
+    scope: Optional[Scope],
+    cost: Cost = None,
+):
+    try:
+        await single_flight.do(
+            key,
+            lambda: _load_and_store(
+                key, loader, ttl, hard_ttl, scope, None, cost
+            ),
+        )
+        _stats["refreshes"] += 1
+    except Exception:
+        _stats["refresh_errors"] += 1
+        logger.exception("Falha ao recarregar entrada de cache %s", key)
+
+
+def _schedule(refresh: Callable[[], Awaitable[Any]]) -> None:
+    task = asyncio.ensure_future(refresh())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def get_or_load(
+    key: str,
+    loader: Loader,
+    ttl: int,
+    hard_ttl: int,
+    request: Optional[Request] = None,
+    scope: Optional[Scope] = None,
+    cost: Cost = None,
+) -> Tuple[Any, bool]:
+    """Retorna (valor, veio_do_cache)."""
+    found = ttl_cache.lookup(key)
+    if found is not None:
+        value, stale = found
+        if stale:
+            _schedule(
+                lambda: _refresh(key, loader, ttl, hard_ttl, scope, cost)
+            )
+        return value, True
+    value = await single_flight.do(
+        key,
+        lambda: _load_and_store(
+            key, loader, ttl, hard_ttl, scope, request, cost
+        ),
+    )
+    return value, False
+
+
+async def refresh_hot_keys() -> None:
+    horizon = settings.CACHE_REFRESH_INTERVAL * 2
+    for _, refresh in ttl_cache.hot_keys(settings.CACHE_HOT_HITS, horizon):
+        _schedule(refresh)
+
+
+def stats() -> Dict[str, Any]:
+    return {**_stats, "refreshing": len(_background)}
+
+
+tasks.register(
+    "cache-refresh", settings.CACHE_REFRESH_INTERVAL, refresh_hot_keys
+)
@@ -0,0 +1,149 @@
+"""
+Manutenção das tabelas de rollup do cube sales (db/rollups.sql).
+
+- rollup_sales_daily / rollup_sales_hourly guardam, por período, loja,
+    canal e status, a contagem de vendas e as somas das medidas
+    aditivas; o translator roteia consultas do cube sales para elas.
+- Atualização incremental: os dias a partir de uma data são recalculados
+    (DELETE + INSERT ... SELECT numa transação, então leitores veem o
+    rollup antigo ou o novo, nunca um meio-termo).
+- Quando o watermark avança, os rollups são atualizados a partir do dia
+    alterado antes de o cache ser invalidado; a tarefa "rollup-refresh"
+    recalcula os últimos ROLLUP_REFRESH_DAYS dias para pegar alterações
+    em vendas existentes (ex.: status), que não movem o watermark.
+- Alterações em vendas mais antigas que isso (não há updated_at em
+    sales para detectá-las) entram na reconciliação: a tarefa
+    "rollup-reconcile" recalcula tudo a cada ROLLUP_RECONCILE_INTERVAL.
+    Esse é o atraso máximo de um rollup em relação a sales.
+- Tabelas vazias recebem a carga completa na primeira execução. O
+    roteamento só é ligado (is_ready) depois da primeira atualização
+    bem-sucedida neste processo.
+- pg_advisory_xact_lock serializa atualizações entre réplicas.
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional
+
+from app.core import tasks
+from app.core.config import settings
+from app.core.db import pool
+from app.core.watermark import watermark
+
+_MEASURES = (
+    "COUNT(*), SUM(total_amount), SUM(total_discount), "
+    "SUM(total_increase), SUM(delivery_fee), SUM(service_tax_fee)"
+)
+_COLUMNS = (
+    "store_id, channel_id, sale_status_desc, orders, total_amount, "
+    "total_discount, total_increase, delivery_fee, service_tax_fee"
+)
+
+# tabela -> (coluna de período, expressão sobre sales.created_at)
+_TABLES = {
+    "rollup_sales_daily": ("day", "DATE(created_at)"),
+    "rollup_sales_hourly": ("bucket", "DATE_TRUNC('hour', created_at)"),
+}
+
+_lock = threading.Lock()
+_state: Dict[str, Any] = {
+    "ready": False,
+    "refreshes": 0,
+    "errors": 0,
+    "last_since": None,
+    "last_seconds": None,
+    "last_full": None,
+}
+# time.monotonic() do último recálculo completo (carga ou reconciliação)
+_last_full: Optional[float] = None
+
+
+def _refresh_sql(table: str, period_col: str, period_expr: str) -> str:
+    return (
+        f"DELETE FROM {table} WHERE {period_col} >= %(since)s;\n"
+        f"INSERT INTO {table} ({period_col}, {_COLUMNS})\n"
+        f"SELECT {period_expr}, store_id, channel_id, sale_status_desc, "
+        f"{_MEASURES}\n"
+        f"FROM sales WHERE created_at >= %(since)s\n"
+        f"GROUP BY 1, 2, 3, 4;"
+    )
+
+
+def refresh(since: Optional[date] = None) -> None:
+    """Recalcula os rollups a partir do dia since.
+
+    Sem since: carga completa se as tabelas estiverem vazias; senão os
+    últimos ROLLUP_REFRESH_DAYS dias.
+    """
+    global _last_full
+    started = time.monotonic()
+    with _lock, pool.connection() as conn:
+        conn.autocommit = False
+        try:
+            with conn.cursor() as cur:
+                # carga completa pode passar do statement_timeout da sessão
+                cur.execute("SET LOCAL statement_timeout = 0")
+                cur.execute(
+                    "SELECT pg_advisory_xact_lock(hashtext('rollup_sales'))"
+                )
+                if since is None:
+                    cur.execute("SELECT 1 FROM rollup_sales_daily LIMIT 1")
+                    if cur.fetchone() is None:
+                        since = date.min
+                    else:
+                        since = date.today() - timedelta(
+                            days=settings.ROLLUP_REFRESH_DAYS
+                        )
+                for table, (col, expr) in _TABLES.items():
+                    sql = _refresh_sql(table, col, expr)
+                    cur.execute(sql, {"since": since})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            _state["errors"] += 1
+            raise
+    if since == date.min:
+        _last_full = started
+        _state["last_full"] = datetime.now().isoformat(timespec="seconds")
+    _state["ready"] = True
+    _state["refreshes"] += 1
+    _state["last_since"] = since.isoformat()
+    _state["last_seconds"] = round(time.monotonic() - started, 3)
+
+
+def reconcile() -> None:
+    """Recalcula os rollups inteiros (vendas antigas alteradas).
+
+    Pula se houve recálculo completo há menos de
+    ROLLUP_RECONCILE_INTERVAL (ex.: a carga inicial no startup).
+    """
+    last = _last_full
+    if (
+        last is not None
+        and time.monotonic() - last < settings.ROLLUP_RECONCILE_INTERVAL
+    ):
+        return
+    refresh(date.min)
+
+
+def _on_watermark(changed_from: date) -> None:
+    if _state["ready"]:
+        refresh(changed_from)
+
+
+def is_ready() -> bool:
+    return settings.ROLLUPS_ENABLED and _state["ready"]
+
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": settings.ROLLUPS_ENABLED, **_state}
+
+
+if settings.ROLLUPS_ENABLED:
+    watermark.on_change(_on_watermark)
+    tasks.register(
+        "rollup-refresh", settings.ROLLUP_REFRESH_INTERVAL, refresh
+    )
+    tasks.register(
+        "rollup-reconcile", settings.ROLLUP_RECONCILE_INTERVAL, reconcile
+    )
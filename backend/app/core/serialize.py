@@ -0,0 +1,117 @@
+"""
+Serialização JSON rápida (orjson) das respostas de consulta.
+
+- Resultados são serializados uma única vez, na carga, e guardados em
+    bytes junto da entrada de cache; hits respondem esses bytes sem
+    passar pelo jsonable_encoder do FastAPI (caro para 10.000 linhas).
+- Decimal segue o decimal_encoder do FastAPI (sem casas decimais vira
+    int, senão float); date/datetime saem em ISO 8601, como antes.
+- json_response monta o envelope da resposta: valores bytes (também
+    dentro de listas e dicts, ex.: /api/query/batch) são JSON já
+    serializado e entram como estão (orjson.Fragment), sem decodificar.
+- ndjson_lines/csv_lines codificam um lote de linhas das respostas em
+    streaming, nas colunas e ordem pedidas.
+- columnar transpõe as linhas em uma lista de valores por coluna (sem
+    repetir o nome da coluna em cada linha); colunas Decimal são
+    convertidas de uma vez, sem o default do orjson célula a célula, e
+    com o mesmo critério do JSON: int se todos os valores são inteiros,
+    senão float.
+- arrow_ipc gera o mesmo resultado em Apache Arrow (IPC stream). O
+    pyarrow é opcional: sem ele, arrow_available() é False.
+"""
+import csv
+import io
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import orjson
+from fastapi import Response
+
+try:
+    import pyarrow
+except ImportError:  # opcional: só para respostas em Arrow
+    pyarrow = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        # mesmo critério de fastapi.encoders.decimal_encoder
+        if obj.as_tuple().exponent >= 0:
+            return int(obj)
+        return float(obj)
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default)
+
+
+def _embed(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return orjson.Fragment(value)
+    if isinstance(value, dict):
+        return {k: _embed(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_embed(v) for v in value]
+    return value
+
+
+def json_response(
+    content: Dict[str, Any], status_code: int = 200
+) -> Response:
+    return Response(
+        content=dumps(_embed(content)),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def ndjson_lines(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    return b"".join(
+        orjson.dumps(
+            {c: row[c] for c in columns},
+            default=_default,
+            option=orjson.OPT_APPEND_NEWLINE,
+        )
+        for row in rows
+    )
+
+
+def csv_lines(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    # None vira campo vazio; datas em ISO 8601 (str)
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerows([row[c] for c in columns] for row in rows)
+    return buf.getvalue().encode()
+
+
+def _column(values: List[Any]) -> List[Any]:
+    decimals = [v for v in values if isinstance(v, Decimal)]
+    if not decimals:
+        return values
+    # um tipo por coluna (Arrow): int só se _default daria int a todos
+    if all(d.as_tuple().exponent >= 0 for d in decimals):
+        return [None if v is None else int(v) for v in values]
+    return [None if v is None else float(v) for v in values]
+
+
+def columnar(
+    rows: List[Dict[str, Any]], columns: List[str]
+) -> List[List[Any]]:
+    """Valores de cada coluna, na ordem de columns."""
+    return [_column([row[c] for row in rows]) for c in columns]
+
+
+def arrow_available() -> bool:
+    return pyarrow is not None
+
+
+def arrow_ipc(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(values) for values in columnar(rows, columns)],
+        names=columns,
+    )
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
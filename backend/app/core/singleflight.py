@@ -0,0 +1,69 @@
+"""
+Single-flight: coalescência de consultas idênticas em andamento.
+
+- Quando várias requisições com a mesma chave de cache erram o cache ao
+    mesmo tempo (ex.: vários gerentes abrindo o mesmo dashboard), só a
+    primeira executa no banco; as demais aguardam o resultado dela.
+- Erros da execução são repassados a quem aguardava. Se a primeira
+    requisição for abortada (cliente desconectou/cancelamento), quem
+    aguardava tenta de novo e uma delas assume a execução.
+- stats() expõe execuções e misses coalescidos para GET /api/metrics.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple, Type
+
+from app.core.db_async import ClientDisconnected
+
+
+class _LeaderAborted(Exception):
+    """A execução líder foi abortada antes de produzir um resultado."""
+
+
+class SingleFlight:
+    def __init__(self, abort_types: Tuple[Type[BaseException], ...] = ()):
+        self.abort_types = (asyncio.CancelledError,) + tuple(abort_types)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._executions = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            fut = self._inflight.get(key)
+            if fut is None:
+                return await self._lead(key, fn)
+            self._coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except _LeaderAborted:
+                continue
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        self._executions += 1
+        try:
+            result = await fn()
+        except self.abort_types:
+            fut.set_exception(_LeaderAborted())
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+            if fut.done() and not fut.cancelled():
+                # evita "Future exception was never retrieved" sem esperas
+                fut.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "in_flight": len(self._inflight),
+        }
+
+
+single_flight = SingleFlight(abort_types=(ClientDisconnected,))
@@ -0,0 +1,55 @@
+"""
+Tarefas periódicas em background.
+
+- Módulos registram funções com register(nome, intervalo, fn); o lifespan
+    do app (main.py) chama start_all() no startup e stop_all() no shutdown.
+- Cada tarefa roda uma vez logo no startup e depois a cada intervalo.
+- Funções síncronas rodam no threadpool; corrotinas rodam no event loop.
+- Exceções são logadas e não interrompem as execuções seguintes.
+"""
+import asyncio
+import logging
+from typing import Callable, List, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger("uvicorn.error")
+
+_registry: List[Tuple[str, float, Callable]] = []
+_running: List[asyncio.Task] = []
+
+
+def register(name: str, interval_seconds: float, fn: Callable) -> None:
+    """Agenda fn a cada interval_seconds (<= 0 desativa a tarefa)."""
+    if interval_seconds > 0:
+        _registry.append((name, interval_seconds, fn))
+
+
+async def run_once(name: str, fn: Callable) -> None:
+    try:
+        if asyncio.iscoroutinefunction(fn):
+            await fn()
+        else:
+            await run_in_threadpool(fn)
+    except Exception:
+        logger.exception("Tarefa %s falhou", name)
+
+
+async def _loop(name: str, interval: float, fn: Callable) -> None:
+    while True:
+        await run_once(name, fn)
+        await asyncio.sleep(interval)
+
+
+def start_all() -> None:
+    for name, interval, fn in _registry:
+        _running.append(
+            asyncio.create_task(_loop(name, interval, fn), name=name)
+        )
+
+
+async def stop_all() -> None:
+    for task in _running:
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
+    _running.clear()
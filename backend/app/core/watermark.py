@@ -0,0 +1,130 @@
+"""
+Watermark dos dados de vendas para invalidação precisa do cache.
+
+- A tarefa "watermark" consulta periodicamente (WATERMARK_INTERVAL)
+    MAX(sales.id) e MAX(sales.created_at) — ambos resolvidos por índice.
+- Quando o watermark avança, descobre o dia mais antigo tocado pelas
+    vendas novas (MIN(created_at) WHERE id > id anterior) e remove do
+    cache apenas as entradas cujo intervalo de datas alcança esse dia.
+- Consultas sobre períodos fechados (terminam antes do último dia com
+    dados) podem ficar em cache por CACHE_CLOSED_TTL (horas).
+- version conta os avanços vistos por este processo (métricas). ETags
+    usam tag(), os próprios valores do watermark: iguais em todas as
+    réplicas e após um restart.
+- Outros módulos podem reagir ao avanço com on_change(fn): fn recebe o
+    dia a partir do qual os dados mudaram e roda antes da invalidação
+    (ex.: core/rollups.py atualiza os rollups antes do cache recarregar).
+
+Limitação: atualizações de vendas antigas (ex.: mudança de status) não
+movem o watermark; por isso períodos abertos mantêm o TTL normal.
+"""
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core import tasks
+from app.core.cache import ttl_cache
+from app.core.config import settings
+from app.core.db import fetch_one
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class Watermark:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_id: Optional[int] = None
+        self.max_created_at: Optional[datetime] = None
+        self.version = 0
+        self.invalidated = 0
+        self._listeners: List[Callable[[date], None]] = []
+
+    def on_change(self, fn: Callable[[date], None]) -> None:
+        self._listeners.append(fn)
+
+    @property
+    def last_day(self) -> Optional[date]:
+        """Último dia com vendas conhecido (None antes do 1º poll)."""
+        m = self.max_created_at
+        return m.date() if m is not None else None
+
+    def is_closed(self, hi: Optional[date]) -> bool:
+        """True se um intervalo que termina em hi não recebe dados novos."""
+        last = self.last_day
+        return hi is not None and last is not None and hi < last
+
+    def tag(self) -> Optional[str]:
+        """MAX(id) e MAX(created_at) para ETags (None antes do 1º poll)."""
+        with self._lock:
+            if self.version == 0:
+                return None
+            created_at = self.max_created_at
+            stamp = created_at.isoformat() if created_at else None
+            return f"{self.max_id}:{stamp}"
+
+    def poll(self) -> None:
+        row = fetch_one(
+            "SELECT MAX(id) AS max_id, MAX(created_at) AS max_created_at "
+            "FROM sales"
+        )
+        max_id = row.get("max_id")
+        max_created_at = row.get("max_created_at")
+        with self._lock:
+            first_poll = self.version == 0
+            prev_id = self.max_id
+            prev_created_at = self.max_created_at
+            if (
+                not first_poll
+                and prev_id == max_id
+                and prev_created_at == max_created_at
+            ):
+                return
+        changed_from: Optional[date] = None
+        if prev_id is not None and max_id is not None and max_id > prev_id:
+            first = fetch_one(
+                "SELECT MIN(created_at) AS min_created_at FROM sales "
+                "WHERE id > %s",
+                (prev_id,),
+            ).get("min_created_at")
+            changed_from = first.date() if first is not None else None
+        elif prev_created_at is not None and max_created_at is not None:
+            # sem ids novos (ex.: exclusões): invalida a partir do menor
+            changed_from = min(prev_created_at, max_created_at).date()
+        with self._lock:
+            self.max_id = max_id
+            self.max_created_at = max_created_at
+            self.version += 1
+        if first_poll:
+            # o cache ainda não dependia do watermark
+            return
+        if changed_from is None:
+            # não foi possível delimitar a mudança: descarta tudo
+            changed_from = date.min
+        for fn in self._listeners:
+            try:
+                fn(changed_from)
+            except Exception:
+                logger.exception("Falha ao propagar avanço do watermark")
+        removed = ttl_cache.invalidate_from(changed_from)
+        self.invalidated += removed
+        logger.info(
+            "Watermark avançou (id=%s, created_at=%s); invalidadas=%s",
+            max_id, max_created_at, removed,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "max_id": self.max_id,
+            "max_created_at": (
+                self.max_created_at.isoformat()
+                if self.max_created_at else None
+            ),
+            "invalidated": self.invalidated,
+        }
+
+
+watermark = Watermark()
+
+tasks.register("watermark", settings.WATERMARK_INTERVAL, watermark.poll)
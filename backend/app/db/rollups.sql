@@ -0,0 +1,46 @@
+-- Tabelas de rollup (pré-agregadas) do cube sales.
+--
+-- Uma linha por (período, loja, canal, status) com medidas aditivas; o
+-- translator roteia consultas do cube sales para cá quando
+-- ROLLUPS_ENABLED=true (ver app/core/rollups.py).
+--
+-- Basta criar as tabelas: o backend faz a carga inicial quando as
+-- encontra vazias e depois mantém os últimos dias atualizados
+-- (incremental: DELETE + INSERT dos dias alterados numa transação).
+
+CREATE TABLE IF NOT EXISTS rollup_sales_daily (
+    day DATE NOT NULL,
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    sale_status_desc VARCHAR(100) NOT NULL,
+    orders BIGINT NOT NULL,
+    total_amount NUMERIC NOT NULL,
+    total_discount NUMERIC,
+    total_increase NUMERIC,
+    delivery_fee NUMERIC,
+    service_tax_fee NUMERIC,
+    PRIMARY KEY (day, store_id, channel_id, sale_status_desc)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_sales_hourly (
+    bucket TIMESTAMP NOT NULL,  -- DATE_TRUNC('hour', created_at)
+    store_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    sale_status_desc VARCHAR(100) NOT NULL,
+    orders BIGINT NOT NULL,
+    total_amount NUMERIC NOT NULL,
+    total_discount NUMERIC,
+    total_increase NUMERIC,
+    delivery_fee NUMERIC,
+    service_tax_fee NUMERIC,
+    PRIMARY KEY (bucket, store_id, channel_id, sale_status_desc)
+);
+
+-- Filtros por status (ex.: COMPLETED) combinados com período
+CREATE INDEX IF NOT EXISTS idx_rollup_daily_status_day
+    ON rollup_sales_daily(sale_status_desc, day);
+CREATE INDEX IF NOT EXISTS idx_rollup_hourly_status_bucket
+    ON rollup_sales_hourly(sale_status_desc, bucket);
+
+-- A carga/atualização incremental filtra sales por created_at: usa
+-- idx_sales_created_at, criado em indexes.sql
@@ -1,40 +1,68 @@
--- Views analíticas (opcionais). No MVP usamos joins diretos nas tabelas base.
--- Este arquivo documenta a intenção e facilita otimizações futuras.
+-- Views analíticas: fatos "achatados" (já com nomes de loja, canal e
+-- produto) para o translator ler sem refazer os joins a cada consulta.
+--
+-- As materialized views são usadas quando FACT_VIEWS_ENABLED=true (ver
+-- app/core/factviews.py): o backend as atualiza com REFRESH ...
+-- CONCURRENTLY (leitores não bloqueiam) e só roteia para elas consultas
+-- de dias já cobertos pela última atualização.
+--
+-- Os índices únicos são obrigatórios para o REFRESH CONCURRENTLY.
 
--- create view vw_dim_time as
--- select
---   date(created_at) as date,
---   extract(year from created_at)::int as year,
---   extract(month from created_at)::int as month,
---   extract(day from created_at)::int as day,
---   to_char(created_at, 'Day') as dow,
---   extract(hour from created_at)::int as hour
--- from sales;
+CREATE OR REPLACE VIEW vw_dim_time AS
+SELECT
+  date(created_at) AS date,
+  extract(year from created_at)::int AS year,
+  extract(month from created_at)::int AS month,
+  extract(day from created_at)::int AS day,
+  to_char(created_at, 'Day') AS dow,
+  extract(hour from created_at)::int AS hour
+FROM sales;
 
--- create view vw_fact_sales as
--- select s.id as sale_id,
---        s.created_at,
---        s.store_id,
---        s.channel_id,
---        s.customer_id,
---        s.sale_status_desc,
---        s.total_amount,
---        s.total_discount,
---        s.delivery_fee,
---        s.service_tax_fee,
---        s.value_paid,
---        s.production_seconds,
---        s.delivery_seconds
--- from sales s;
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_fact_sales AS
+SELECT s.id AS sale_id,
+       s.created_at,
+       s.store_id,
+       st.name AS store_name,
+       s.channel_id,
+       ch.name AS channel_name,
+       s.customer_id,
+       s.sale_status_desc,
+       s.total_amount,
+       s.total_discount,
+       s.total_increase,
+       s.delivery_fee,
+       s.service_tax_fee,
+       s.value_paid,
+       s.production_seconds,
+       s.delivery_seconds
+FROM sales s
+JOIN stores st ON st.id = s.store_id
+JOIN channels ch ON ch.id = s.channel_id;
 
--- create view vw_fact_product_sales as
--- select ps.id as product_sale_id,
---        ps.sale_id,
---        s.created_at,
---        s.store_id,
---        s.channel_id,
---        ps.product_id,
---        ps.quantity,
---        ps.total_price
--- from product_sales ps
--- join sales s on s.id = ps.sale_id;
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_fact_sales
+    ON mv_fact_sales(sale_id);
+CREATE INDEX IF NOT EXISTS idx_mv_fact_sales_created_at
+    ON mv_fact_sales(created_at);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_fact_product_sales AS
+SELECT ps.id AS product_sale_id,
+       ps.sale_id,
+       s.created_at,
+       s.store_id,
+       st.name AS store_name,
+       s.channel_id,
+       ch.name AS channel_name,
+       ps.product_id,
+       p.name AS product_name,
+       ps.quantity,
+       ps.total_price
+FROM product_sales ps
+JOIN sales s ON s.id = ps.sale_id
+JOIN products p ON p.id = ps.product_id
+JOIN stores st ON st.id = s.store_id
+JOIN channels ch ON ch.id = s.channel_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mv_fact_product_sales
+    ON mv_fact_product_sales(product_sale_id);
+CREATE INDEX IF NOT EXISTS idx_mv_fact_product_sales_created_at
+    ON mv_fact_product_sales(created_at);
@@ -5,18 +5,53 @@ Responsabilidades principais:
 - Validar papéis (roles) contra whitelists de medidas e dimensões (model.yaml).
 - Mapear nomes qualificados (ex.: sales.total_amount) para expressões SQL.
 - Aplicar granularidade de tempo (DATE_TRUNC) quando solicitado.
+- Filtros de time.date viram intervalos semiabertos na coluna crua
+    (created_at >= início AND created_at < fim), com os limites
+    alinhados à granularidade: mesmo resultado de DATE()/DATE_TRUNC(),
+    mas usando os índices de created_at.
 - Montar SELECT, FROM/JOIN, WHERE (filtros), GROUP BY e ORDER BY.
+- Emitir só os joins cujos aliases a consulta referencia (JOINS); os
+    joins seguem FKs NOT NULL, então o número de linhas não muda.
 - Proteger com LIMIT máximo (10.000) e ordenar apenas por colunas selecionadas.
+- Compilar várias quebras das mesmas medidas e filtros num único
+    GROUP BY GROUPING SETS (build_grouping_sets_sql): uma leitura da
+    tabela fato em vez de uma por gráfico.
+- Modo aproximado (sample): ler a tabela fato com TABLESAMPLE, escalar
+    as medidas aditivas e estimar o erro padrão de cada uma.
+- Comparar o período filtrado com o anterior ou o mesmo do ano passado
+    (compare) numa só leitura: o WHERE pega os dois intervalos e cada
+    medida é agregada duas vezes com FILTER (WHERE ...).
+- Expor o orçamento de custo de cada role (role_budget, model.yaml) para
+    o controle de admissão (core/costguard.py).
+- Normalizar consultas equivalentes (canonicalize) para que gerem o mesmo
+    SQL e, portanto, a mesma chave de cache.
+- Informar o intervalo de datas lido por uma consulta (time_range), usado
+    na invalidação do cache por watermark.
+- Declarar como cada medida se reagrega (MEASURE_ROLLUP) e identificar o
+    conjunto filtrado (where_signature), para derivar consultas mais
+    grossas de resultados mais finos já em cache (core/derive.py).
+- Rotear o cube sales para a menor tabela de rollup que responde à
+    consulta (diária; horária só com granularity=hour), quando os rollups
+    estão ligados e carregados (core/rollups.py).
+- Ler dos fatos achatados (materialized views de db/views.sql) quando o
+    período já está coberto pela última atualização (core/factviews.py).
+- Senão, tabelas base.
 
 Como extender:
 - Para adicionar um novo cube, declare em model.yaml e crie novos maps
     DIM_MAP_*/MEAS_MAP_*.
-# Ajuste _from_and_joins para refletir as tabelas e joins necessários.
+# Declare em JOINS a tabela fato e os joins do cube (alias, SQL, alias de
+# que depende); só os joins referenciados pela consulta são emitidos.
 """
 from typing import List, Tuple, Dict, Any, Optional
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
+import re
 import yaml
 
+from app.core import factviews, rollups
+
 
 def _load_model() -> dict:
     model_path = Path(__file__).resolve().parent / "model.yaml"
@@ -56,6 +91,15 @@ DIM_MAP_SALES = {
     "sales.status": ("s.sale_status_desc", "text"),
 }
 
+# Expressões de time.date por granularidade nas tabelas base; "column" é
+# a coluna indexada usada nos filtros de período (_time_range_sql)
+TIME_SQL_BASE = {
+    "column": "s.created_at",
+    "day": "DATE(s.created_at)",
+    "month": "DATE_TRUNC('month', s.created_at)",
+    "hour": "DATE_TRUNC('hour', s.created_at)",
+}
+
 MEAS_MAP_SALES = {
     "sales.total_amount": ("SUM(s.total_amount)", "numeric"),
     "sales.orders": ("COUNT(*)", "int"),
@@ -101,6 +145,188 @@ MEAS_MAP_PAYMENTS = {
 }
 
 
+# Rollups do cube sales (db/rollups.sql): uma linha por período, loja,
+# canal e status, com contagem e somas. Somar as somas dá o mesmo
+# resultado (SUM ignora NULL) e a contagem vira SUM(r.orders).
+DIM_MAP_ROLLUP_DAILY = {
+    "time.date": ("r.day", "date"),
+    "store.name": ("st.name", "text"),
+    "channel.name": ("ch.name", "text"),
+    "sales.status": ("r.sale_status_desc", "text"),
+}
+DIM_MAP_ROLLUP_HOURLY = {
+    **DIM_MAP_ROLLUP_DAILY,
+    "time.date": ("DATE(r.bucket)", "date"),
+}
+# day é DATE: converte para timestamp para DATE_TRUNC devolver o mesmo
+# tipo (timestamp sem fuso) que nas tabelas base
+TIME_SQL_ROLLUP_DAILY = {
+    "column": "r.day",
+    "day": "r.day",
+    "month": "DATE_TRUNC('month', r.day::timestamp)",
+}
+TIME_SQL_ROLLUP_HOURLY = {
+    "column": "r.bucket",
+    "day": "DATE(r.bucket)",
+    "month": "DATE_TRUNC('month', r.bucket)",
+    "hour": "r.bucket",
+}
+
+MEAS_MAP_ROLLUP = {
+    "sales.total_amount": ("SUM(r.total_amount)", "numeric"),
+    "sales.orders": ("SUM(r.orders)::bigint", "int"),
+    "sales.ticket_medio": (
+        "SUM(r.total_amount) / "
+        "NULLIF(SUM(r.orders), 0)",
+        "numeric",
+    ),
+    "sales.discount": ("SUM(r.total_discount)", "numeric"),
+    "sales.delivery_fee": ("SUM(r.delivery_fee)", "numeric"),
+    "sales.service_fee": ("SUM(r.service_tax_fee)", "numeric"),
+    "sales.increase": ("SUM(r.total_increase)", "numeric"),
+}
+
+
+# Fatos achatados (materialized views, db/views.sql): nomes de loja,
+# canal e produto já vêm na linha, sem joins
+TIME_SQL_FACT = {
+    "column": "f.created_at",
+    "day": "DATE(f.created_at)",
+    "month": "DATE_TRUNC('month', f.created_at)",
+    "hour": "DATE_TRUNC('hour', f.created_at)",
+}
+
+DIM_MAP_FACT_SALES = {
+    "time.date": ("DATE(f.created_at)", "date"),
+    "store.name": ("f.store_name", "text"),
+    "channel.name": ("f.channel_name", "text"),
+    "sales.status": ("f.sale_status_desc", "text"),
+}
+
+MEAS_MAP_FACT_SALES = {
+    "sales.total_amount": ("SUM(f.total_amount)", "numeric"),
+    "sales.orders": ("COUNT(*)", "int"),
+    "sales.ticket_medio": (
+        "SUM(f.total_amount) / "
+        "NULLIF(COUNT(*), 0)",
+        "numeric",
+    ),
+    "sales.discount": ("SUM(f.total_discount)", "numeric"),
+    "sales.delivery_fee": ("SUM(f.delivery_fee)", "numeric"),
+    "sales.service_fee": ("SUM(f.service_tax_fee)", "numeric"),
+    "sales.increase": ("SUM(f.total_increase)", "numeric"),
+}
+
+DIM_MAP_FACT_PRODUCTS = {
+    "time.date": ("DATE(f.created_at)", "date"),
+    "store.name": ("f.store_name", "text"),
+    "channel.name": ("f.channel_name", "text"),
+    "product.name": ("f.product_name", "text"),
+}
+
+MEAS_MAP_FACT_PRODUCTS = {
+    "products.quantity": ("SUM(f.quantity)", "numeric"),
+    "products.revenue": ("SUM(f.total_price)", "numeric"),
+}
+
+# cube -> (view, dim_map, meas_map)
+FACT_VIEWS = {
+    "sales": ("mv_fact_sales", DIM_MAP_FACT_SALES, MEAS_MAP_FACT_SALES),
+    "products": (
+        "mv_fact_product_sales",
+        DIM_MAP_FACT_PRODUCTS,
+        MEAS_MAP_FACT_PRODUCTS,
+    ),
+}
+
+
+def canonicalize(
+    measures: List[str],
+    dimensions: List[str],
+    filters: List[Dict[str, Any]],
+) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+    """Forma canônica de medidas, dimensões e filtros.
+
+    A ordem de medidas/dimensões não altera o resultado (as linhas são
+    dicionários por nome de coluna), nem a ordem dos filtros (AND) ou dos
+    valores de um 'in'. Um 'in' com um único valor equivale a 'equals'.
+    """
+    canon_filters: Dict[str, Dict[str, Any]] = {}
+    for f in filters:
+        op = f.get("op")
+        values = list(f.get("values", []))
+        if op in ("equals", "in") and not values:
+            raise ValueError(f"Filtro {op} requer ao menos 1 valor")
+        if op == "equals":
+            values = values[:1]
+        elif op == "in":
+            values = sorted(set(values))
+            if len(values) == 1:
+                op = "equals"
+        item = {"dimension": f.get("dimension"), "op": op, "values": values}
+        canon_filters[repr(sorted(item.items()))] = item
+    return (
+        sorted(set(measures)),
+        sorted(set(dimensions)),
+        [canon_filters[k] for k in sorted(canon_filters)],
+    )
+
+
+def _month_end(d: date) -> date:
+    first_next = date(d.year + d.month // 12, d.month % 12 + 1, 1)
+    return first_next - timedelta(days=1)
+
+
+def time_range(
+    filters: List[Dict[str, Any]],
+    granularity: Optional[str],
+) -> Tuple[Optional[date], Optional[date]]:
+    """Intervalo de datas (inclusivo) que os filtros de time.date leem.
+
+    Conservador: valores que não parecem datas deixam o lado sem limite.
+    Com granularity=month o filtro compara o mês truncado, então o fim
+    do intervalo vai até o último dia do mês.
+    """
+    lo: Optional[date] = None
+    hi: Optional[date] = None
+    for f in filters:
+        if f.get("dimension") != "time.date" or not f.get("values"):
+            continue
+        try:
+            days = [date.fromisoformat(str(v)[:10]) for v in f["values"]]
+        except ValueError:
+            continue
+        if f.get("op") == "between" and len(days) == 2:
+            f_lo, f_hi = days
+        else:
+            f_lo, f_hi = min(days), max(days)
+        if granularity == "month":
+            f_hi = _month_end(f_hi)
+        lo = f_lo if lo is None else max(lo, f_lo)
+        hi = f_hi if hi is None else min(hi, f_hi)
+    return lo, hi
+
+
+# Como cada medida se recompõe a partir de grupos mais finos: "sum" e
+# "count" são aditivas; "ratio" divide duas medidas aditivas do cubo.
+MEASURE_ROLLUP: Dict[str, Tuple[str, ...]] = {
+    "sales.total_amount": ("sum",),
+    "sales.orders": ("count",),
+    "sales.ticket_medio": ("ratio", "sales.total_amount", "sales.orders"),
+    "sales.discount": ("sum",),
+    "sales.delivery_fee": ("sum",),
+    "sales.service_fee": ("sum",),
+    "sales.increase": ("sum",),
+    "products.quantity": ("sum",),
+    "products.revenue": ("sum",),
+    "payments.amount": ("sum",),
+    "payments.count": ("count",),
+}
+
+# Granularidades de time.date, da mais fina para a mais grossa
+TIME_GRAINS = ("hour", "day", "month")
+
+
 def _validate_role(spec: QuerySpec):
     if not spec.role:
         return
@@ -128,6 +354,19 @@ def _validate_role(spec: QuerySpec):
             )
 
 
+def role_budget(role: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Orçamento de custo da role em model.yaml.
+
+    None = role sem budget (fora do controle); {} = padrões COST_GUARD_*.
+    """
+    if not role:
+        return None
+    role_def = MODEL.get("roles", {}).get(role) or {}
+    if "budget" not in role_def:
+        return None
+    return dict(role_def["budget"] or {})
+
+
 def _cube_maps(cube: str):
     if cube == "sales":
         return DIM_MAP_SALES, MEAS_MAP_SALES
@@ -138,33 +377,69 @@ def _cube_maps(cube: str):
     raise ValueError(f"Cube desconhecido: {cube}")
 
 
-def _from_and_joins(cube: str) -> Tuple[str, List[str]]:
-    if cube == "sales":
-        return (
-            "FROM sales s \n"
-            "JOIN stores st ON st.id = s.store_id \n"
-            "JOIN channels ch ON ch.id = s.channel_id",
-            [],
-        )
-    if cube == "products":
-        return (
-            "FROM product_sales ps \n"
-            "JOIN sales s ON s.id = ps.sale_id \n"
-            "JOIN products p ON p.id = ps.product_id \n"
-            "JOIN stores st ON st.id = s.store_id \n"
-            "JOIN channels ch ON ch.id = s.channel_id",
-            [],
-        )
-    if cube == "payments":
-        return (
-            "FROM payments pay \n"
-            "JOIN sales s ON s.id = pay.sale_id \n"
-            "JOIN stores st ON st.id = s.store_id \n"
-            "JOIN channels ch ON ch.id = s.channel_id \n"
-            "LEFT JOIN payment_types pt ON pt.id = pay.payment_type_id",
-            [],
-        )
-    raise ValueError("Cube inválido")
+# cube -> (FROM, joins). Cada join é (alias, SQL, alias de que depende).
+# Todos os JOIN internos seguem FKs NOT NULL (sales.store_id,
+# sales.channel_id, product_sales.sale_id/product_id, payments.sale_id) e
+# o LEFT JOIN vai para uma PK: remover um join não usado não muda o
+# número de linhas, então só emitimos os que a consulta referencia.
+JOINS = {
+    "sales": (
+        "FROM sales s",
+        [
+            ("st", "JOIN stores st ON st.id = s.store_id", "s"),
+            ("ch", "JOIN channels ch ON ch.id = s.channel_id", "s"),
+        ],
+    ),
+    "products": (
+        "FROM product_sales ps",
+        [
+            ("s", "JOIN sales s ON s.id = ps.sale_id", "ps"),
+            ("p", "JOIN products p ON p.id = ps.product_id", "ps"),
+            ("st", "JOIN stores st ON st.id = s.store_id", "s"),
+            ("ch", "JOIN channels ch ON ch.id = s.channel_id", "s"),
+        ],
+    ),
+    "payments": (
+        "FROM payments pay",
+        [
+            ("s", "JOIN sales s ON s.id = pay.sale_id", "pay"),
+            ("st", "JOIN stores st ON st.id = s.store_id", "s"),
+            ("ch", "JOIN channels ch ON ch.id = s.channel_id", "s"),
+            (
+                "pt",
+                "LEFT JOIN payment_types pt "
+                "ON pt.id = pay.payment_type_id",
+                "pay",
+            ),
+        ],
+    ),
+}
+
+_ALIAS_RE = re.compile(r"\b([a-z]+)\.[a-z_]")
+
+
+def _aliases(exprs: List[str]) -> set:
+    """Aliases de tabela referenciados pelas expressões SQL."""
+    found = set()
+    for e in exprs:
+        found.update(_ALIAS_RE.findall(e))
+    return found
+
+
+def _prune_joins(
+    base: str,
+    joins: List[Tuple[str, str, str]],
+    aliases: set,
+) -> str:
+    """FROM só com os joins dos aliases usados (e dos que eles exigem)."""
+    needed = set(aliases)
+    # joins vêm depois dos que exigem: de trás para frente, um join usado
+    # marca o alias de que depende
+    for alias, _, dep in reversed(joins):
+        if alias in needed:
+            needed.add(dep)
+    kept = [sql for alias, sql, _ in joins if alias in needed]
+    return " \n".join([base] + kept)
 
 
 def _apply_granularity(
@@ -187,6 +462,234 @@ def _apply_granularity(
     return out
 
 
+def _dim_sql(
+    dim_map: Dict[str, Tuple[str, str]],
+    name: str,
+    granularity: Optional[str],
+    time_sql: Dict[str, str] = TIME_SQL_BASE,
+) -> str:
+    # substituir time.date conforme granularity
+    if name == "time.date" and granularity in ("month", "hour"):
+        return time_sql[granularity]
+    return dim_map[name][0]
+
+
+def _parse_time_value(value: Any) -> datetime:
+    # Mesma leitura do Postgres para '2025-01-31' ou '2025-01-31T10:00';
+    # fuso é descartado, como na conversão para timestamp sem fuso
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"Data inválida em filtro de time.date: {value}")
+    return parsed.replace(tzinfo=None)
+
+
+def _floor(dt: datetime, grain: str) -> datetime:
+    if grain == "month":
+        return datetime(dt.year, dt.month, 1)
+    if grain == "hour":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return datetime(dt.year, dt.month, dt.day)
+
+
+def _next(dt: datetime, grain: str) -> datetime:
+    if grain == "month":
+        return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+    if grain == "hour":
+        return dt + timedelta(hours=1)
+    return dt + timedelta(days=1)
+
+
+def _lower_bound(value: Any, grain: str) -> datetime:
+    """Menor created_at cujo time.date (na granularidade) é >= value."""
+    dt = _parse_time_value(value)
+    start = _floor(dt, grain)
+    if grain == "day" or start == dt:
+        # no dia o valor vira DATE (trunca); em mês/hora vira timestamp
+        # e só períodos que começam a partir dele contam
+        return start
+    return _next(start, grain)
+
+
+def _upper_bound(value: Any, grain: str) -> datetime:
+    """Primeiro created_at cujo time.date (na granularidade) é > value."""
+    return _next(_floor(_parse_time_value(value), grain), grain)
+
+
+def _filter_params(
+    f: Dict[str, Any], granularity: Optional[str]
+) -> List[Any]:
+    """Parâmetros de um filtro, na ordem dos placeholders do seu SQL."""
+    op = f.get("op")
+    values = list(f.get("values", []))
+    if op == "equals":
+        values = values[:1]
+    if f.get("dimension") != "time.date":
+        return values
+    # time.date: cada valor vira um intervalo [início, fim) de created_at
+    grain = granularity if granularity in ("month", "hour") else "day"
+    if op == "between":
+        if len(values) != 2:
+            raise ValueError("Filtro between requer 2 valores")
+        return [
+            _lower_bound(values[0], grain), _upper_bound(values[1], grain)
+        ]
+    params: List[Any] = []
+    for v in values:
+        params += [_lower_bound(v, grain), _upper_bound(v, grain)]
+    return params
+
+
+def _time_range_sql(column: str, op: str, n_values: int) -> str:
+    # Intervalos semiabertos na coluna crua: o índice de created_at (ou do
+    # período no rollup) é usado, sem DATE()/DATE_TRUNC() no predicado
+    if op == "between":
+        return f"{column} >= %s AND {column} < %s"
+    if n_values == 0:
+        raise ValueError(f"Filtro {op} requer ao menos 1 valor")
+    ranges = [f"{column} >= %s AND {column} < %s"] * n_values
+    if len(ranges) == 1:
+        return ranges[0]
+    return "(" + " OR ".join(f"({r})" for r in ranges) + ")"
+
+
+def _compile_filters(
+    filters: List[Dict[str, Any]],
+    dim_map: Dict[str, Tuple[str, str]],
+    granularity: Optional[str],
+    time_sql: Dict[str, str] = TIME_SQL_BASE,
+) -> List[str]:
+    """Predicados do WHERE; os valores vêm de _bind_params."""
+    where_parts: List[str] = []
+    for f in filters:
+        dim = f.get("dimension")
+        op = f.get("op")
+        values = f.get("values", [])
+        if dim not in dim_map:
+            raise ValueError(f"Filtro em dimensão desconhecida: {dim}")
+        dim_sql = _dim_sql(dim_map, dim, granularity, time_sql)
+
+        if op not in ("equals", "in", "between"):
+            raise ValueError(f"Operação de filtro inválida: {op}")
+        if op == "between" and len(values) != 2:
+            raise ValueError("Filtro between requer 2 valores")
+        if dim == "time.date":
+            n_values = 1 if op == "equals" else len(values)
+            where_parts.append(
+                _time_range_sql(time_sql["column"], op, n_values)
+            )
+        elif op == "equals":
+            where_parts.append(f"{dim_sql} = %s")
+        elif op == "in":
+            placeholders = ",".join(["%s"] * len(values))
+            where_parts.append(f"{dim_sql} IN ({placeholders})")
+        else:
+            where_parts.append(f"{dim_sql} BETWEEN %s AND %s")
+    return where_parts
+
+
+def _rollup_route(spec: QuerySpec) -> Optional[str]:
+    """Tabela de rollup que responde à consulta, ou None.
+
+    O roteamento é transparente, então herda o atraso dos rollups:
+    vendas novas e dos últimos ROLLUP_REFRESH_DAYS dias entram em até
+    ROLLUP_REFRESH_INTERVAL; alterações em vendas mais antigas, em até
+    ROLLUP_RECONCILE_INTERVAL (core/rollups.py), mais o TTL do cache.
+    """
+    if spec.cube != "sales" or not rollups.is_ready():
+        return None
+    if not spec.measures and not spec.dimensions:
+        # COUNT(*) "rows" contaria linhas do rollup, não vendas
+        return None
+    used_dims = set(spec.dimensions)
+    used_dims.update(f.get("dimension") for f in spec.filters)
+    if not used_dims <= set(DIM_MAP_ROLLUP_DAILY):
+        return None
+    if not set(spec.measures) <= set(MEAS_MAP_ROLLUP):
+        return None
+    if spec.granularity == "hour" and "time.date" in used_dims:
+        return "rollup_sales_hourly"
+    return "rollup_sales_daily"
+
+
+def _fact_view_route(spec: QuerySpec) -> Optional[str]:
+    """Materialized view de fatos que cobre o período, ou None."""
+    fact = FACT_VIEWS.get(spec.cube)
+    if fact is None:
+        return None
+    _, hi = time_range(spec.filters, spec.granularity)
+    return fact[0] if factviews.covers(fact[0], hi) else None
+
+
+def _route(spec: QuerySpec) -> Optional[str]:
+    """Fonte alternativa às tabelas base (None = tabelas base)."""
+    dim_map, meas_map = _cube_maps(spec.cube)
+    # Dimensões e medidas desconhecidas são rejeitadas pelos maps base;
+    # rollups e views só são usados se cobrirem a consulta toda.
+    if not all(d in dim_map for d in spec.dimensions):
+        return None
+    if not all(m in meas_map for m in spec.measures):
+        return None
+    return _rollup_route(spec) or _fact_view_route(spec)
+
+
+# Rollups guardam store_id/channel_id: os nomes vêm por join
+ROLLUP_JOINS = [
+    ("st", "JOIN stores st ON st.id = r.store_id", "r"),
+    ("ch", "JOIN channels ch ON ch.id = r.channel_id", "r"),
+]
+
+
+def _source(cube: str, route: Optional[str]):
+    """(dim_map, meas_map, (FROM, joins), time_sql) de uma rota."""
+    if route in ("rollup_sales_daily", "rollup_sales_hourly"):
+        source = (f"FROM {route} r", ROLLUP_JOINS)
+        if route == "rollup_sales_hourly":
+            return (
+                DIM_MAP_ROLLUP_HOURLY, MEAS_MAP_ROLLUP, source,
+                TIME_SQL_ROLLUP_HOURLY,
+            )
+        return (
+            DIM_MAP_ROLLUP_DAILY, MEAS_MAP_ROLLUP, source,
+            TIME_SQL_ROLLUP_DAILY,
+        )
+    if route is not None:
+        view, dim_map, meas_map = FACT_VIEWS[cube]
+        return dim_map, meas_map, (f"FROM {view} f", []), TIME_SQL_FACT
+    dim_map, meas_map = _cube_maps(cube)
+    return dim_map, meas_map, JOINS[cube], TIME_SQL_BASE
+
+
+def where_signature(
+    cube: str,
+    filters: List[Dict[str, Any]],
+    granularity: Optional[str],
+) -> Tuple[str, ...]:
+    """Identifica o conjunto de linhas filtrado (WHERE compilado).
+
+    Duas consultas com a mesma assinatura agregam exatamente as mesmas
+    linhas da tabela fato, mesmo com granularidades diferentes.
+    """
+    dim_map, _ = _cube_maps(cube)
+    where_parts = _compile_filters(filters, dim_map, granularity)
+    params = _bind_params(filters, granularity)
+    return (cube, " AND ".join(where_parts), *map(str, params))
+
+
+def _filter_arity(f: Dict[str, Any]) -> int:
+    return 1 if f.get("op") == "equals" else len(f.get("values", []))
+
+
+def _bind_params(
+    filters: List[Dict[str, Any]], granularity: Optional[str]
+) -> List[Any]:
+    """Parâmetros na ordem dos placeholders do template de build_sql."""
+    params: List[Any] = []
+    for f in filters:
+        params.extend(_filter_params(f, granularity))
+    return params
+
+
 def build_sql(
     cube: str,
     role: Optional[str],
@@ -196,13 +699,127 @@ def build_sql(
     granularity: Optional[str],
     order: List[Dict[str, str]],
     limit: int,
+    top_n: Optional[Dict[str, Any]] = None,
+    sample: Optional[Dict[str, Any]] = None,
+    compare: Optional[str] = None,
 ) -> Tuple[str, List[Any], List[str]]:
+    """Compila a consulta: (sql, params, col_names).
+
+    O SQL depende só do formato da consulta (cube, role, medidas,
+    dimensões, dimensão/op/aridade dos filtros, granularity, order,
+    limit, top_n) e da rota escolhida; a compilação fica memoizada por
+    formato (_compile_shape) e os valores dos filtros viram apenas params.
+
+    Com top_n ({"by": medida, "n": N}) o SQL devolve os N grupos com
+    maior "by" ("__part" 0, em ordem), uma linha "outros" com o restante
+    reagregado (1, só se houver) e o total geral (2); order e limit são
+    ignorados.
+
+    Com sample ({"method": "system"|"bernoulli", "percent": p}) a tabela
+    fato é lida com TABLESAMPLE (sempre nas tabelas base): medidas
+    aditivas são escaladas por 100/p e cada medida ganha a coluna
+    "<medida>_stderr" com o erro padrão estimado (ver _sampled_measure).
+
+    Com compare ("previous_period" | "previous_year") o filtro de
+    time.date define o período atual e o SQL lê também o de comparação
+    (compare_periods): cada medida "m" sai como "m" (atual),
+    "m_previous" e "m_delta" (atual - anterior).
+    """
     spec = QuerySpec(
         cube, role, measures, dimensions, filters, granularity, order, limit
     )
+    filter_shape = tuple(
+        (f.get("dimension"), f.get("op"), _filter_arity(f))
+        for f in spec.filters
+    )
+    if top_n and sample:
+        raise ValueError("top_n não pode ser combinado com approximate")
+    if compare and (top_n or sample):
+        raise ValueError(
+            "compare não pode ser combinado com top_n ou approximate"
+        )
+    periods = None
+    if compare:
+        periods = compare_periods(spec.filters, spec.granularity, compare)
+        # o filtro de período vira dois intervalos (atual OU anterior)
+        filter_shape = tuple(
+            ("time.date", "in", 2) if d == "time.date" else (d, op, n)
+            for d, op, n in filter_shape
+        )
+    sql, col_names = _compile_shape(
+        spec.cube,
+        spec.role,
+        tuple(spec.measures),
+        tuple(spec.dimensions),
+        filter_shape,
+        spec.granularity,
+        tuple((o.get("by"), o.get("dir", "desc")) for o in spec.order or []),
+        spec.limit,
+        None if sample else _route(spec),
+        (top_n["by"], int(top_n["n"])) if top_n else None,
+        (sample["method"], float(sample["percent"])) if sample else None,
+        compare,
+    )
+    if periods is None:
+        params = _bind_params(spec.filters, spec.granularity)
+        return sql, params, list(col_names)
+    (cur_lo, cur_hi), (prev_lo, prev_hi) = periods
+    # CROSS JOIN cmp (limites usados nos FILTER) vem antes do WHERE
+    params = [cur_lo, prev_hi]
+    for f in spec.filters:
+        if f.get("dimension") == "time.date":
+            params += [cur_lo, cur_hi, prev_lo, prev_hi]
+        else:
+            params += _filter_params(f, spec.granularity)
+    return sql, params, list(col_names)
+
+
+def compile_stats() -> Dict[str, Any]:
+    info = _compile_shape.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "shapes": info.currsize,
+        "max_shapes": info.maxsize,
+    }
+
+
+@lru_cache(maxsize=1024)
+def _compile_shape(
+    cube: str,
+    role: Optional[str],
+    measures: Tuple[str, ...],
+    dimensions: Tuple[str, ...],
+    filter_shape: Tuple[Tuple[Any, Any, int], ...],
+    granularity: Optional[str],
+    order_shape: Tuple[Tuple[Any, Any], ...],
+    limit: int,
+    route: Optional[str],
+    top_n: Optional[Tuple[str, int]] = None,
+    sample: Optional[Tuple[str, float]] = None,
+    compare: Optional[str] = None,
+) -> Tuple[str, Tuple[str, ...]]:
+    # Filtros com valores fictícios: só dimensão, op e aridade importam
+    filters = [
+        {"dimension": d, "op": op, "values": [""] * n}
+        for d, op, n in filter_shape
+    ]
+    order = [{"by": by, "dir": direction} for by, direction in order_shape]
+    spec = QuerySpec(
+        cube,
+        role,
+        list(measures),
+        list(dimensions),
+        filters,
+        granularity,
+        order,
+        limit,
+    )
     _validate_role(spec)
 
-    dim_map, meas_map = _cube_maps(spec.cube)
+    dim_map, meas_map, (base, joins), time_sql = _source(spec.cube, route)
+    if sample is not None:
+        base += _tablesample(*sample)
 
     # Mapear select
     select_cols: List[str] = []
@@ -215,16 +832,15 @@ def build_sql(
         if d not in dim_map:
             raise ValueError(f"Dimensão desconhecida: {d}")
         dims_with_gran.append(d)
+    if compare is not None:
+        if "time.date" in spec.dimensions:
+            # os dois períodos cairiam em linhas diferentes
+            raise ValueError("compare não aceita time.date como dimensão")
+        if not spec.measures:
+            raise ValueError("compare requer ao menos uma medida")
 
-    # substituir time.date conforme granularity
     def dim_sql_token(name: str) -> str:
-        if name == "time.date" and granularity == "month":
-            return "DATE_TRUNC('month', s.created_at)"
-        if name == "time.date" and granularity == "hour":
-            return "DATE_TRUNC('hour', s.created_at)"
-        if name == "time.date":
-            return dim_map[name][0]
-        return dim_map[name][0]
+        return _dim_sql(dim_map, name, granularity, time_sql)
 
     for d in dims_with_gran:
         select_cols.append(f"{dim_sql_token(d)} AS \"{d}\"")
@@ -234,6 +850,23 @@ def build_sql(
     for m in spec.measures:
         if m not in meas_map:
             raise ValueError(f"Medida desconhecida: {m}")
+        if sample is not None:
+            estimate, stderr = _sampled_measure(
+                m, meas_map[m][0], sample[1]
+            )
+            select_cols.append(f"{estimate} AS \"{m}\"")
+            select_cols.append(f"{stderr} AS \"{m}_stderr\"")
+            col_names.extend([m, f"{m}_stderr"])
+            continue
+        if compare is not None:
+            current, previous, delta = _compared_measure(
+                m, meas_map[m][0], time_sql["column"]
+            )
+            select_cols.append(f"{current} AS \"{m}\"")
+            select_cols.append(f"{previous} AS \"{m}_previous\"")
+            select_cols.append(f"{delta} AS \"{m}_delta\"")
+            col_names.extend([m, f"{m}_previous", f"{m}_delta"])
+            continue
         select_cols.append(f"{meas_map[m][0]} AS \"{m}\"")
         col_names.append(m)
 
@@ -243,40 +876,32 @@ def build_sql(
         else "COUNT(*) AS \"rows\""
     )
 
-    from_clause, _ = _from_and_joins(spec.cube)
-
     # Filtros (somente whitelisted)
-    where_parts: List[str] = []
-    params: List[Any] = []
-    for f in spec.filters:
-        dim = f.get("dimension")
-        op = f.get("op")
-        values = f.get("values", [])
-        if dim not in dim_map:
-            raise ValueError(f"Filtro em dimensão desconhecida: {dim}")
-        dim_sql = dim_map[dim][0]
-        if dim == "time.date" and granularity in ("month", "hour"):
-            dim_sql = dim_sql_token(dim)
-
-        if op == "equals":
-            where_parts.append(f"{dim_sql} = %s")
-            params.append(values[0])
-        elif op == "in":
-            placeholders = ",".join(["%s"] * len(values))
-            where_parts.append(f"{dim_sql} IN ({placeholders})")
-            params.extend(values)
-        elif op == "between":
-            if len(values) != 2:
-                raise ValueError("Filtro between requer 2 valores")
-            where_parts.append(f"{dim_sql} BETWEEN %s AND %s")
-            params.extend(values)
-        else:
-            raise ValueError(f"Operação de filtro inválida: {op}")
+    where_parts = _compile_filters(
+        spec.filters, dim_map, granularity, time_sql
+    )
 
     where_clause = "WHERE " + " AND ".join(where_parts) if where_parts else ""
 
+    # Só os joins que SELECT/WHERE/GROUP BY referenciam
+    from_clause = _prune_joins(
+        base, joins, _aliases(select_cols + where_parts + group_cols)
+    )
+    if compare is not None:
+        from_clause += (
+            "\nCROSS JOIN (SELECT %s::timestamp AS cur_lo, "
+            "%s::timestamp AS prev_hi) cmp"
+        )
+
     group_clause = f"GROUP BY {', '.join(group_cols)}" if group_cols else ""
 
+    if top_n is not None:
+        sql = _top_n_sql(
+            spec, top_n, meas_map, select_cols, from_clause, where_clause,
+            group_clause,
+        )
+        return sql, tuple(col_names)
+
     # Ordenação segura (apenas por colunas selecionadas)
     order_clause = ""
     safe_cols = set(col_names)
@@ -312,4 +937,340 @@ def build_sql(
         + limit_clause
     )
 
-    return sql, params, col_names
+    return sql, tuple(col_names)
+
+
+def _grouping_mask(dims: List[str], grouping: List[str]) -> int:
+    """Valor de GROUPING(dims...) nas linhas da quebra grouping.
+
+    O bit de cada dimensão (a primeira é o mais significativo) vale 1
+    quando ela não faz parte do agrupamento.
+    """
+    n = len(dims)
+    return sum(
+        1 << (n - 1 - i) for i, d in enumerate(dims) if d not in grouping
+    )
+
+
+def build_grouping_sets_sql(
+    cube: str,
+    role: Optional[str],
+    measures: List[str],
+    groupings: List[List[str]],
+    filters: List[Dict[str, Any]],
+    granularity: Optional[str],
+    order: List[Dict[str, str]],
+    limit: int,
+) -> Tuple[str, List[Any], List[str], List[int]]:
+    """Várias quebras das mesmas medidas e filtros num único SELECT.
+
+    Compila GROUP BY GROUPING SETS: uma leitura da tabela fato para
+    todas as quebras (ex.: por dia, por loja, por canal e total). Cada
+    linha traz "__grouping" (GROUPING() das dimensões) e limit/order
+    valem por quebra. A ordem das quebras e das dimensões de cada uma
+    não altera o SQL. Retorna (sql, params, dims, masks): dims são as
+    colunas de dimensão do SELECT e masks[i] o "__grouping" das linhas
+    da quebra groupings[i].
+    """
+    canon = sorted({tuple(sorted(set(g))) for g in groupings})
+    dims = list(dict.fromkeys(d for g in canon for d in g))
+    if not dims:
+        raise ValueError("Informe ao menos uma dimensão em groupings")
+    spec = QuerySpec(
+        cube, role, measures, dims, filters, granularity, order, limit
+    )
+    filter_shape = tuple(
+        (f.get("dimension"), f.get("op"), _filter_arity(f))
+        for f in spec.filters
+    )
+    sql = _compile_grouping_shape(
+        spec.cube,
+        spec.role,
+        tuple(spec.measures),
+        tuple(canon),
+        filter_shape,
+        spec.granularity,
+        tuple((o.get("by"), o.get("dir", "desc")) for o in spec.order or []),
+        spec.limit,
+        _route(spec),
+    )
+    params = _bind_params(spec.filters, spec.granularity)
+    masks = [_grouping_mask(dims, g) for g in groupings]
+    return sql, params, dims, masks
+
+
+@lru_cache(maxsize=256)
+def _compile_grouping_shape(
+    cube: str,
+    role: Optional[str],
+    measures: Tuple[str, ...],
+    groupings: Tuple[Tuple[str, ...], ...],
+    filter_shape: Tuple[Tuple[Any, Any, int], ...],
+    granularity: Optional[str],
+    order_shape: Tuple[Tuple[Any, Any], ...],
+    limit: int,
+    route: Optional[str],
+) -> str:
+    dims = list(dict.fromkeys(d for g in groupings for d in g))
+    filters = [
+        {"dimension": d, "op": op, "values": [""] * n}
+        for d, op, n in filter_shape
+    ]
+    spec = QuerySpec(
+        cube, role, list(measures), dims, filters, granularity, [], limit
+    )
+    _validate_role(spec)
+
+    dim_map, meas_map, (base, joins), time_sql = _source(spec.cube, route)
+    for d in dims:
+        if d not in dim_map:
+            raise ValueError(f"Dimensão desconhecida: {d}")
+    for m in spec.measures:
+        if m not in meas_map:
+            raise ValueError(f"Medida desconhecida: {m}")
+
+    dim_sql = {d: _dim_sql(dim_map, d, granularity, time_sql) for d in dims}
+    select_cols = [f"{dim_sql[d]} AS \"{d}\"" for d in dims]
+    select_cols += [f"{meas_map[m][0]} AS \"{m}\"" for m in spec.measures]
+    select_cols.append(
+        f"GROUPING({', '.join(dim_sql[d] for d in dims)}) AS \"__grouping\""
+    )
+
+    sets = [
+        "(" + ", ".join(dim_sql[d] for d in dims if d in g) + ")"
+        for g in groupings
+    ]
+
+    where_parts = _compile_filters(
+        spec.filters, dim_map, granularity, time_sql
+    )
+    where_clause = "WHERE " + " AND ".join(where_parts) if where_parts else ""
+    from_clause = _prune_joins(
+        base, joins, _aliases(select_cols + where_parts)
+    )
+
+    # Ordenação e limite por quebra (ROW_NUMBER por "__grouping");
+    # dimensões ausentes de uma quebra são NULL e não afetam a ordem
+    safe_cols = set(dims) | set(spec.measures)
+    order_parts = []
+    for by, direction in order_shape:
+        if by not in safe_cols:
+            raise ValueError(f"Ordenação por coluna não selecionada: {by}")
+        direction = (direction or "desc").lower()
+        if direction not in ("asc", "desc"):
+            direction = "desc"
+        order_parts.append(f'"{by}" {direction}')
+    window = 'PARTITION BY "__grouping"'
+    if order_parts:
+        window += " ORDER BY " + ", ".join(order_parts)
+
+    return (
+        "SELECT * FROM (\n"
+        f"SELECT g.*, ROW_NUMBER() OVER ({window}) AS \"__rn\"\n"
+        "FROM (\n"
+        "SELECT \n       "
+        + ", \n       ".join(select_cols)
+        + "\n"
+        + from_clause
+        + "\n"
+        + (where_clause + "\n" if where_clause else "")
+        + f"GROUP BY GROUPING SETS ({', '.join(sets)})\n"
+        ") g\n"
+        ") t\n"
+        f"WHERE \"__rn\" <= {int(spec.limit)}\n"
+        'ORDER BY "__grouping", "__rn"'
+    )
+
+
+# Semente fixa: a mesma consulta lê a mesma amostra (enquanto a tabela
+# não muda) e pode ser cacheada como as exatas
+SAMPLE_SEED = 1
+SAMPLE_METHODS = ("system", "bernoulli")
+
+_SUM_RE = re.compile(r"^SUM\((.+)\)$")
+
+
+def _tablesample(method: str, percent: float) -> str:
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"Método de amostragem inválido: {method}")
+    if not 0 < percent <= 100:
+        raise ValueError("approximate.percent deve estar em (0, 100]")
+    return (
+        f" TABLESAMPLE {method.upper()} ({percent!r})"
+        f" REPEATABLE ({SAMPLE_SEED})"
+    )
+
+
+def _sampled_measure(m: str, expr: str, percent: float) -> Tuple[str, str]:
+    """(estimativa, erro padrão) de uma medida lida de uma amostra.
+
+    Estimador de Horvitz-Thompson com fração f = percent/100: somas e
+    contagens da amostra divididas por f, com variância
+    (1 - f) / f² * soma de x² na amostra. O erro assume amostragem por
+    linha (BERNOULLI); com SYSTEM (blocos) ele tende a ser subestimado.
+    Razões não são escaladas e ficam sem erro padrão (NULL).
+    """
+    f = percent / 100
+    rule = MEASURE_ROLLUP.get(m, ("",))[0]
+    if rule == "count":
+        return (
+            f"ROUND(COUNT(*) / {f!r})::bigint",
+            f"SQRT({1 - f!r} * COUNT(*)) / {f!r}",
+        )
+    if rule == "sum":
+        arg = _SUM_RE.match(expr)
+        if arg is None:
+            raise ValueError(f"Medida não suportada em approximate: {m}")
+        x = arg.group(1)
+        return (
+            f"{expr} / {f!r}",
+            f"SQRT({1 - f!r} * SUM(({x}) * ({x}))) / {f!r}",
+        )
+    if rule == "ratio":
+        return expr, "NULL::numeric"
+    raise ValueError(f"Medida não suportada em approximate: {m}")
+
+
+COMPARE_MODES = ("previous_period", "previous_year")
+
+_AGG_RE = re.compile(r"\b(?:SUM|COUNT)\([^()]*\)")
+
+Period = Tuple[datetime, datetime]
+
+
+def _shift_months(dt: datetime, months: int) -> datetime:
+    total = dt.year * 12 + dt.month - 1 + months
+    year, month = divmod(total, 12)
+    # 29/02 (ou 31) num mês mais curto vira o último dia dele
+    day = min(dt.day, _month_end(date(year, month + 1, 1)).day)
+    return dt.replace(year=year, month=month + 1, day=day)
+
+
+def compare_periods(
+    filters: List[Dict[str, Any]],
+    granularity: Optional[str],
+    compare: str,
+) -> Tuple[Period, Period]:
+    """([início, fim) atual, [início, fim) de comparação) em created_at.
+
+    O período atual é o único filtro de time.date (between ou equals),
+    com os mesmos limites do WHERE comum. "previous_period" é o intervalo
+    de mesmo tamanho logo antes dele (em meses com granularity=month);
+    "previous_year" é o mesmo intervalo um ano antes.
+    """
+    if compare not in COMPARE_MODES:
+        raise ValueError(f"compare inválido: {compare}")
+    periods = [f for f in filters if f.get("dimension") == "time.date"]
+    if len(periods) != 1 or periods[0].get("op") not in (
+        "between", "equals"
+    ):
+        raise ValueError(
+            "compare requer um único filtro de time.date (between ou equals)"
+        )
+    lo, hi = _filter_params(periods[0], granularity)[:2]
+    if compare == "previous_year":
+        return (lo, hi), (_shift_months(lo, -12), _shift_months(hi, -12))
+    if granularity == "month":
+        months = (hi.year - lo.year) * 12 + hi.month - lo.month
+        return (lo, hi), (_shift_months(lo, -months), lo)
+    return (lo, hi), (lo - (hi - lo), lo)
+
+
+def _compared_measure(
+    m: str, expr: str, column: str
+) -> Tuple[str, str, str]:
+    """(atual, anterior, delta) de uma medida com compare.
+
+    Cada agregado da expressão ganha FILTER pelo período; dentro do WHERE
+    (atual OU anterior) basta comparar com o início do atual e o fim do
+    anterior, que vêm do CROSS JOIN cmp. No delta, somas e contagens sem
+    linhas no período contam como 0.
+    """
+    current = _AGG_RE.sub(
+        lambda a: f"{a.group(0)} FILTER (WHERE {column} >= cmp.cur_lo)",
+        expr,
+    )
+    previous = _AGG_RE.sub(
+        lambda a: f"{a.group(0)} FILTER (WHERE {column} < cmp.prev_hi)",
+        expr,
+    )
+    if MEASURE_ROLLUP.get(m, ("",))[0] in ("sum", "count"):
+        delta = f"COALESCE({current}, 0) - COALESCE({previous}, 0)"
+    else:
+        delta = f"{current} - {previous}"
+    return current, previous, delta
+
+
+def _top_n_sql(
+    spec: QuerySpec,
+    top_n: Tuple[str, int],
+    meas_map: Dict[str, Tuple[str, str]],
+    select_cols: List[str],
+    from_clause: str,
+    where_clause: str,
+    group_clause: str,
+) -> str:
+    """Top N grupos por uma medida + "outros" + total, num só SELECT.
+
+    Os grupos são numerados por ROW_NUMBER() sobre o resultado agrupado;
+    "outros" e o total reagregam esses grupos (MEASURE_ROLLUP), então
+    razões como sales.ticket_medio são recalculadas de soma e contagem.
+    """
+    by, n = top_n
+    if not spec.dimensions:
+        raise ValueError("top_n requer ao menos uma dimensão")
+    if by not in spec.measures:
+        raise ValueError(f"top_n por medida não selecionada: {by}")
+    if n < 1:
+        raise ValueError("top_n.n deve ser ao menos 1")
+
+    # componentes de razões que não foram pedidos entram só no agrupado
+    hidden: List[str] = []
+    aggregates: List[str] = []
+    for m in spec.measures:
+        rule = MEASURE_ROLLUP.get(m)
+        if rule is None:
+            raise ValueError(f"Medida sem reagregação para top_n: {m}")
+        if rule[0] == "ratio":
+            num, den = rule[1], rule[2]
+            for c in (num, den):
+                if c not in spec.measures and c not in hidden:
+                    hidden.append(c)
+            aggregates.append(
+                f'SUM("{num}") / NULLIF(SUM("{den}"), 0) AS "{m}"'
+            )
+        elif rule[0] == "count":
+            aggregates.append(f'COALESCE(SUM("{m}"), 0)::bigint AS "{m}"')
+        else:
+            aggregates.append(f'SUM("{m}") AS "{m}"')
+    inner_cols = select_cols + [
+        f"{meas_map[c][0]} AS \"{c}\"" for c in hidden
+    ]
+
+    dims = ", ".join(f'"{d}"' for d in spec.dimensions)
+    cols = dims + ", " + ", ".join(f'"{m}"' for m in spec.measures)
+    nulls = ", ".join("NULL" for _ in spec.dimensions)
+    rest = ", ".join(aggregates)
+    return (
+        "WITH r AS (\n"
+        f"SELECT g.*, ROW_NUMBER() OVER (ORDER BY \"{by}\" DESC NULLS LAST"
+        f", {dims}) AS \"__rank\"\n"
+        "FROM (\n"
+        "SELECT \n       "
+        + ", \n       ".join(inner_cols)
+        + "\n"
+        + from_clause
+        + "\n"
+        + (where_clause + "\n" if where_clause else "")
+        + group_clause
+        + "\n) g\n"
+        ")\n"
+        f'SELECT {cols}, 0 AS "__part", "__rank" FROM r '
+        f'WHERE "__rank" <= {int(n)}\n'
+        "UNION ALL\n"
+        f'SELECT {nulls}, {rest}, 1, NULL FROM r WHERE "__rank" > {int(n)}'
+        " HAVING COUNT(*) > 0\n"
+        "UNION ALL\n"
+        f"SELECT {nulls}, {rest}, 2, NULL FROM r\n"
+        'ORDER BY "__part", "__rank"'
+    )
@@ -4,25 +4,56 @@ Aplicação FastAPI principal.
 - Faz o bootstrap do app, configurando CORS e registrando as rotas.
 - Rotas sob o prefixo /api: metadata, query, distinct e utilidades.
 - O middleware de CORS lê origens permitidas de settings (env ALLOW_ORIGINS).
-- Endpoint /health para healthcheck de container e load balancer.
+- Respostas comprimidas conforme Accept-Encoding (core/compression.py).
+- /health (liveness): 200 enquanto o processo responde.
+- /ready (readiness): 503 "warming" até o cache aquecer; é o que o
+  ingress, o docker-compose e o deploy esperam antes de rotear tráfego.
+- O lifespan abre os pools de conexões e inicia as tarefas periódicas
+  (core/tasks.py) no startup; no shutdown, encerra ambos.
+- No startup o cache é aquecido com as consultas dos dashboards
+  (app/warmup.py); enquanto isso /ready responde 503 "warming".
 
 Observações para iniciantes:
 - Se o frontend estiver em outro domínio, ajuste ALLOW_ORIGINS (lista de URLs).
 - Em produção, desative origens genéricas para evitar acessos indevidos.
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response
 import logging
 
 from app.api.metadata import router as metadata_router
 from app.api.query import router as query_router
 from app.api.quick import router as quick_router
 from app.api.distinct import router as distinct_router
+from app.api.metrics import router as metrics_router
+from app import warmup
+from app.core import tasks
+from app.core.compression import CompressionMiddleware
+from app.core.costguard import OverBudget
 from app.core.config import settings
+from app.core.db import PoolTimeout
+from app.core.db_async import ClientDisconnected, QueryTimeout
+from app.core.executor import close_pools, open_pools
 from app.api import datarange as datarange_module
 
-app = FastAPI(title="Restaurant Analytics API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_pools()
+    tasks.start_all()
+    warmup.start()
+    yield
+    await warmup.stop()
+    await tasks.stop_all()
+    await close_pools()
+
+
+app = FastAPI(
+    title="Restaurant Analytics API", version="0.1.0", lifespan=lifespan
+)
 
 # CORS: ajuste origins conforme deploy do frontend
 app.add_middleware(
@@ -31,6 +62,8 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # o frontend lê o ETag para revalidar POSTs com If-None-Match
+    expose_headers=["ETag", "X-Cached"],
 )
 
 # Redireciona para HTTPS quando suportado pelo ambiente
@@ -64,6 +97,45 @@ async def security_headers(request: Request, call_next):
     )
     return response
 
+
+# Adicionado por último: é o middleware mais externo e comprime a
+# resposta já com os cabeçalhos finais
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    """Pool saturado: pede ao cliente que tente novamente em instantes."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(OverBudget)
+async def over_budget_handler(request: Request, exc: OverBudget):
+    # a estimativa permite à UI explicar a recusa
+    return JSONResponse(
+        status_code=422,
+        content={"detail": str(exc), "estimate": exc.estimate},
+    )
+
+
+@app.exception_handler(QueryTimeout)
+async def query_timeout_handler(request: Request, exc: QueryTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(
+    request: Request, exc: ClientDisconnected
+):
+    # Ninguém vai ler a resposta; 499 segue a convenção do nginx
+    return Response(status_code=499)
+
+
 # Log de alerta se CORS estiver permissivo em produção
 if settings.ALLOW_ORIGINS == ["*"]:
     logging.getLogger("uvicorn.error").warning(
@@ -76,8 +148,18 @@ app.include_router(query_router, prefix="/api")
 app.include_router(quick_router, prefix="/api")
 app.include_router(distinct_router, prefix="/api")
 app.include_router(datarange_module.router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
 
 
 @app.get("/health")
 def health():
+    # liveness: aquecendo ainda está vivo (não reiniciar a réplica)
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready():
+    if not warmup.is_ready():
+        # réplica nova: o ingress espera o cache aquecer
+        return JSONResponse(status_code=503, content={"status": "warming"})
     return {"status": "ok"}
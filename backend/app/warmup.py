@@ -0,0 +1,148 @@
+"""
+Aquecimento do cache no startup da réplica.
+
+- Lê domain/warmup.yaml (as consultas dos dashboards de Marketing,
+    Gerência e Financeiro nos períodos padrão da UI) e executa cada uma
+    pelo mesmo caminho de /api/query (compile_query + execute), enchendo
+    o ttl_cache antes do primeiro usuário.
+- Datas ({today}, {month_start}, ...) são resolvidas no fuso
+    WARMUP_TIMEZONE, o mesmo do navegador dos usuários, para gerar
+    exatamente as chaves que a UI vai pedir.
+- Roda em background no lifespan; /ready responde 503 ("warming") até
+    terminar ou até WARMUP_TIMEOUT, para o ingress só rotear tráfego à
+    réplica já aquecida.
+- Falhas de uma consulta são logadas e não impedem as demais.
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import yaml
+
+from app.api.query import QueryRequest, compile_query, execute
+from app.core.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+WARMUP_PATH = Path(__file__).resolve().parent / "domain" / "warmup.yaml"
+
+_state: Dict[str, Any] = {
+    "status": "disabled" if not settings.WARMUP_ENABLED else "pending",
+    "queries": 0,
+    "warmed": 0,
+    "failed": 0,
+    "seconds": None,
+}
+_task: Optional[asyncio.Task] = None
+
+
+def _placeholders(today: date) -> Dict[str, str]:
+    month_start = today.replace(day=1)
+    m = today.month - 5
+    y = today.year + (m - 1) // 12
+    six_months_start = date(y, (m - 1) % 12 + 1, 1)
+    return {
+        "today": today.isoformat(),
+        "month_start": month_start.isoformat(),
+        "six_months_start": six_months_start.isoformat(),
+    }
+
+
+def _fill(value: Any, names: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return value.format(**names)
+    if isinstance(value, list):
+        return [_fill(v, names) for v in value]
+    if isinstance(value, dict):
+        return {k: _fill(v, names) for k, v in value.items()}
+    return value
+
+
+def load_specs(today: Optional[date] = None) -> List[Dict[str, Any]]:
+    """Consultas de aquecimento com as datas já resolvidas."""
+    if today is None:
+        today = datetime.now(ZoneInfo(settings.WARMUP_TIMEZONE)).date()
+    with WARMUP_PATH.open("r", encoding="utf-8") as f:
+        doc = yaml.safe_load(f) or {}
+    base = _placeholders(today)
+    periods = doc.get("periods") or {"default": ["{today}", "{today}"]}
+    specs: List[Dict[str, Any]] = []
+    seen = set()
+    for start, end in periods.values():
+        names = {
+            **base,
+            "start": start.format(**base),
+            "end": end.format(**base),
+        }
+        for query in doc.get("queries") or []:
+            spec = _fill(query, names)
+            # períodos iguais (ex.: dia 1º do mês) geram a mesma consulta
+            marker = repr(spec)
+            if marker not in seen:
+                seen.add(marker)
+                specs.append(spec)
+    return specs
+
+
+async def _warm_one(spec: Dict[str, Any], sem: asyncio.Semaphore) -> None:
+    async with sem:
+        try:
+            await execute(compile_query(QueryRequest(**spec)))
+            _state["warmed"] += 1
+        except Exception:
+            _state["failed"] += 1
+            logger.exception("Falha ao aquecer consulta %s", spec)
+
+
+async def run() -> None:
+    started = time.monotonic()
+    _state["status"] = "warming"
+    try:
+        specs = load_specs()
+        _state["queries"] = len(specs)
+        sem = asyncio.Semaphore(max(1, settings.WARMUP_CONCURRENCY))
+        await asyncio.wait_for(
+            asyncio.gather(*(_warm_one(s, sem) for s in specs)),
+            timeout=settings.WARMUP_TIMEOUT,
+        )
+        _state["status"] = "done"
+    except asyncio.TimeoutError:
+        # segue sem o restante: melhor servir frio do que não servir
+        _state["status"] = "timeout"
+        logger.warning(
+            "Aquecimento do cache excedeu %ss", settings.WARMUP_TIMEOUT
+        )
+    except Exception:
+        _state["status"] = "error"
+        logger.exception("Falha ao carregar %s", WARMUP_PATH)
+    finally:
+        _state["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "Aquecimento do cache: %s/%s consultas em %ss (%s)",
+        _state["warmed"], _state["queries"], _state["seconds"],
+        _state["status"],
+    )
+
+
+def start() -> None:
+    global _task
+    if settings.WARMUP_ENABLED:
+        _task = asyncio.create_task(run(), name="warmup")
+
+
+async def stop() -> None:
+    if _task is not None and not _task.done():
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+
+
+def is_ready() -> bool:
+    return _state["status"] not in ("pending", "warming")
+
+
+def stats() -> Dict[str, Any]:
+    return dict(_state)
@@ -0,0 +1,93 @@
+"""
+Verifica via EXPLAIN que os filtros de time.date usam índice em sales.
+
+Requer um banco com o schema e os índices de app/db/indexes.sql
+(DATABASE_URL). Para cada granularidade compila uma consulta com o
+translator e confere que o plano lê sales por índice (Index/Bitmap
+Scan), não por Seq Scan. enable_seqscan=off faz o planner preferir o
+índice sempre que o predicado permitir: se ainda sobrar Seq Scan, o
+filtro não é indexável.
+
+Os limites dos intervalos são testados sem banco em
+scripts/test_time_filters.py; no CI este script roda só quando o secret
+EXPLAIN_DATABASE_URL está definido.
+
+Uso: python scripts/explain_time_filters.py
+"""
+import json
+import os
+import sys
+
+# Add backend package root to sys.path
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.dirname(CURRENT_DIR)
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+import psycopg2  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.domain.translator import build_sql  # noqa: E402
+
+PERIOD = {
+    "dimension": "time.date",
+    "op": "between",
+    "values": ["2025-05-01", "2025-05-07"],
+}
+COMPLETED = {"dimension": "sales.status", "op": "equals",
+             "values": ["COMPLETED"]}
+DAYS = {"dimension": "time.date", "op": "in",
+        "values": ["2025-05-01", "2025-05-15"]}
+
+CASES = [
+    ("sales", ["sales.total_amount"], ["time.date"], [PERIOD], None),
+    ("sales", ["sales.total_amount"], ["time.date"], [PERIOD], "month"),
+    ("sales", ["sales.total_amount"], ["time.date"], [PERIOD], "hour"),
+    ("sales", ["sales.orders"], ["store.name"], [PERIOD, COMPLETED], None),
+    ("sales", ["sales.orders"], ["channel.name"], [DAYS], None),
+    ("products", ["products.revenue"], ["product.name"], [PERIOD], None),
+    ("payments", ["payments.amount"], ["payment.type"], [PERIOD], "month"),
+]
+
+
+def _scans(plan):
+    """(tipo do nó, índice) de cada leitura da tabela sales."""
+    if plan.get("Relation Name") == "sales":
+        yield plan["Node Type"], plan.get("Index Name")
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+
+def run_case(cur, cube, measures, dimensions, filters, granularity):
+    sql, params, _ = build_sql(
+        cube=cube,
+        role=None,
+        measures=measures,
+        dimensions=dimensions,
+        filters=filters,
+        granularity=granularity,
+        order=[],
+        limit=100,
+    )
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = list(_scans(plan[0]["Plan"]))
+    label = f"{cube} {dimensions} granularity={granularity}"
+    print(label, scans)
+    assert scans, f"{label}: sales não aparece no plano"
+    for node, _ in scans:
+        assert node != "Seq Scan", f"{label}: Seq Scan em sales"
+
+
+if __name__ == "__main__":
+    conn = psycopg2.connect(settings.DATABASE_URL)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET enable_seqscan = off")
+            for case in CASES:
+                run_case(cur, *case)
+    finally:
+        conn.close()
+    print("OK: filtros de time.date usam índice em sales")
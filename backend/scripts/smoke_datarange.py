@@ -2,6 +2,9 @@ import os
 import sys
 from unittest.mock import patch
 
+from starlette.requests import Request
+from starlette.responses import Response
+
 # Add backend package root to sys.path
 CURRENT_DIR = os.path.dirname(__file__)
 BACKEND_ROOT = os.path.dirname(CURRENT_DIR)
@@ -9,6 +12,7 @@ if BACKEND_ROOT not in sys.path:
     sys.path.insert(0, BACKEND_ROOT)
 
 from app.api.datarange import data_range  # noqa: E402
+from app.core.db import pool  # noqa: E402
 
 
 class FakeCursor:
@@ -30,14 +34,20 @@ class FakeCursor:
 
 
 class FakeConn:
+    closed = 0
+    autocommit = False
+
     def __init__(self, row):
         self._row = row
 
     def cursor(self, cursor_factory=None):
         return FakeCursor(self._row)
 
+    def get_transaction_status(self):
+        return 0  # TRANSACTION_STATUS_IDLE
+
     def close(self):
-        pass
+        self.closed = 1
 
 
 def run_case(cube, row):
@@ -45,11 +55,14 @@ def run_case(cube, row):
         return FakeConn(row)
 
     with patch("psycopg2.connect", side_effect=fake_connect):
-        body = data_range(cube=cube)
+        request = Request({"type": "http", "headers": []})
+        body = data_range(request=request, response=Response(), cube=cube)
         print(cube, body)
         assert body["cube"] == cube
         assert body["min_date"] == row.get("min_date")
         assert body["max_date"] == row.get("max_date")
+    # descarta a conexão falsa para o próximo caso abrir uma nova
+    pool.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+"""
+Testes (sem banco) dos intervalos semiabertos dos filtros de time.date.
+
+O translator troca DATE(created_at)/DATE_TRUNC(...) comparados ao valor
+por created_at >= início AND created_at < fim, para usar o índice. Aqui
+conferimos, só em Python, que os dois predicados aceitam exatamente os
+mesmos instantes: por granularidade (dia, mês, hora), por operação
+(equals, between, in) e na virada de dezembro para janeiro.
+
+O EXPLAIN com banco real fica em scripts/explain_time_filters.py.
+
+Uso: python scripts/test_time_filters.py (ou pytest scripts/)
+"""
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+# Add backend package root to sys.path
+CURRENT_DIR = os.path.dirname(__file__)
+BACKEND_ROOT = os.path.dirname(CURRENT_DIR)
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+from app.domain.translator import (  # noqa: E402
+    _filter_params,
+    _lower_bound,
+    _time_range_sql,
+    _upper_bound,
+    build_sql,
+)
+
+# De 30/11 a 02/01, de meia em meia hora e 1µs antes de cada uma:
+# cobre virada de mês e de ano e os dois lados de cada limite
+INSTANTS = [
+    datetime(2025, 11, 30) + timedelta(minutes=30 * i) - timedelta(
+        microseconds=us
+    )
+    for i in range(33 * 48)
+    for us in (0, 1)
+]
+
+VALUES = [
+    "2025-12-01",
+    "2025-12-15",
+    "2025-12-31",
+    "2026-01-01",
+    "2025-12-31 23:00:00",
+    "2025-12-31T23:30:00",
+]
+
+
+def _truncated(ts: datetime, grain: str):
+    """O que o SQL antigo comparava: DATE(...) ou DATE_TRUNC(...)."""
+    if grain == "day":
+        return ts.date()
+    if grain == "month":
+        return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _as_sql_value(value: str, grain: str):
+    """O valor como o Postgres o leria contra a expressão truncada."""
+    ts = datetime.fromisoformat(value)
+    # date = 'YYYY-MM-DD HH:MM' converte o texto para date (trunca)
+    return ts.date() if grain == "day" else ts
+
+
+def _in_range(ts: datetime, bounds) -> bool:
+    return any(
+        lo <= ts < hi for lo, hi in zip(bounds[::2], bounds[1::2])
+    )
+
+
+def _check(op: str, values, grain: str) -> None:
+    granularity = None if grain == "day" else grain
+    f = {"dimension": "time.date", "op": op, "values": values}
+    bounds = _filter_params(f, granularity)
+    wanted = [_as_sql_value(v, grain) for v in values]
+    for ts in INSTANTS:
+        t = _truncated(ts, grain)
+        if op == "between":
+            expected = wanted[0] <= t <= wanted[1]
+        elif op == "equals":
+            expected = t == wanted[0]
+        else:
+            expected = t in wanted
+        assert _in_range(ts, bounds) == expected, (op, values, grain, ts)
+
+
+def test_bounds_day():
+    assert _lower_bound("2025-12-15", "day") == datetime(2025, 12, 15)
+    assert _upper_bound("2025-12-15", "day") == datetime(2025, 12, 16)
+    # hora no valor: DATE() descarta, o dia inteiro conta
+    assert _lower_bound("2025-12-15 10:00", "day") == datetime(2025, 12, 15)
+
+
+def test_bounds_month():
+    assert _lower_bound("2025-11-01", "month") == datetime(2025, 11, 1)
+    # meio do mês: DATE_TRUNC('month') >= 15/11 só vale a partir de 12/2025
+    assert _lower_bound("2025-11-15", "month") == datetime(2025, 12, 1)
+    assert _upper_bound("2025-11-15", "month") == datetime(2025, 12, 1)
+
+
+def test_bounds_hour():
+    assert _lower_bound("2025-12-15 10:00", "hour") == datetime(
+        2025, 12, 15, 10
+    )
+    assert _lower_bound("2025-12-15 10:30", "hour") == datetime(
+        2025, 12, 15, 11
+    )
+    assert _upper_bound("2025-12-15 10:30", "hour") == datetime(
+        2025, 12, 15, 11
+    )
+
+
+def test_december_to_january():
+    assert _upper_bound("2025-12-31", "day") == datetime(2026, 1, 1)
+    assert _upper_bound("2025-12-15", "month") == datetime(2026, 1, 1)
+    assert _lower_bound("2025-12-15", "month") == datetime(2026, 1, 1)
+    assert _upper_bound("2025-12-31 23:00", "hour") == datetime(2026, 1, 1)
+    assert _lower_bound("2025-12-31 23:30", "hour") == datetime(2026, 1, 1)
+
+
+def test_equivalence():
+    for grain in ("day", "month", "hour"):
+        for v in VALUES:
+            _check("equals", [v], grain)
+            _check("in", [v], grain)
+        for i, a in enumerate(VALUES):
+            for b in VALUES[i:]:
+                _check("between", [a, b], grain)
+        _check("in", ["2025-12-01", "2025-12-31", "2026-01-01"], grain)
+
+
+def test_range_sql():
+    col = "created_at"
+    assert _time_range_sql(col, "between", 2) == (
+        "created_at >= %s AND created_at < %s"
+    )
+    assert _time_range_sql(col, "equals", 1) == (
+        "created_at >= %s AND created_at < %s"
+    )
+    assert _time_range_sql(col, "in", 2) == (
+        "((created_at >= %s AND created_at < %s) OR "
+        "(created_at >= %s AND created_at < %s))"
+    )
+    try:
+        _time_range_sql(col, "in", 0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("in sem valores deveria falhar")
+
+
+def test_build_sql_uses_raw_column():
+    for granularity in (None, "month", "hour"):
+        sql, params, _ = build_sql(
+            cube="sales",
+            role=None,
+            measures=["sales.total_amount"],
+            dimensions=["time.date"],
+            filters=[{
+                "dimension": "time.date",
+                "op": "between",
+                "values": ["2025-12-01", "2025-12-31"],
+            }],
+            granularity=granularity,
+            order=[],
+            limit=100,
+        )
+        where = sql.split("WHERE", 1)[1].split("GROUP BY", 1)[0]
+        assert "DATE(" not in where and "DATE_TRUNC(" not in where, where
+        assert ">= %s" in where and "< %s" in where, where
+        assert all(
+            isinstance(p, (date, datetime)) for p in params[:2]
+        ), params
+
+
+if __name__ == "__main__":
+    tests = [
+        (name, fn) for name, fn in sorted(globals().items())
+        if name.startswith("test_") and callable(fn)
+    ]
+    for name, fn in tests:
+        fn()
+        print("ok", name)
+    print(f"OK: {len(tests)} testes de filtros de time.date")
@@ -3,6 +3,46 @@
 // - Configure VITE_API_BASE_URL no .env.local do frontend para apontar para o backend.
 const API_BASE = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000'
 
+// Revalidação de POSTs com ETag: o navegador não guarda respostas de POST,
+// então guardamos { etag, data } por corpo e reenviamos If-None-Match.
+// Um 304 reaproveita o JSON local sem baixar o resultado de novo.
+// GETs (metadata, data-range) já são revalidados pelo cache do navegador.
+const ETAG_CACHE_MAX = 200
+const etagCache = new Map()
+
+async function postWithETag(path, body, errorLabel) {
+  const payload = JSON.stringify(body)
+  const cacheKey = `${path}|${payload}`
+  const known = etagCache.get(cacheKey)
+  const headers = { 'Content-Type': 'application/json' }
+  if (known) headers['If-None-Match'] = known.etag
+  const res = await fetch(`${API_BASE}${path}`, {
+    method: 'POST',
+    headers,
+    body: payload,
+  })
+  if (res.status === 304 && known) {
+    // reinsere para manter a ordem de uso recente
+    etagCache.delete(cacheKey)
+    etagCache.set(cacheKey, known)
+    return { ...known.data, cached: true }
+  }
+  if (!res.ok) {
+    const msg = await res.text()
+    throw new Error(`${errorLabel}: ${msg}`)
+  }
+  const data = await res.json()
+  const etag = res.headers.get('ETag')
+  etagCache.delete(cacheKey)
+  if (etag) {
+    etagCache.set(cacheKey, { etag, data })
+    if (etagCache.size > ETAG_CACHE_MAX) {
+      etagCache.delete(etagCache.keys().next().value)
+    }
+  }
+  return data
+}
+
 export async function getMetadata() {
   const res = await fetch(`${API_BASE}/api/metadata`)
   if (!res.ok) throw new Error('Falha ao carregar metadata')
@@ -11,30 +51,50 @@ export async function getMetadata() {
 
 export async function runQuery(body) {
   // Executa consultas analíticas (ver contrato em ARQUITETURA.md)
-  const res = await fetch(`${API_BASE}/api/query`, {
+  return postWithETag('/api/query', body, 'Erro na consulta')
+}
+
+export async function estimateQuery(body) {
+  // Custo estimado (EXPLAIN) e orçamento da role, sem executar; action diz
+  // o que /api/query faria: run, reject, approximate ou queue
+  const res = await fetch(`${API_BASE}/api/query/estimate`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify(body),
   })
   if (!res.ok) {
     const msg = await res.text()
-    throw new Error(`Erro na consulta: ${msg}`)
+    throw new Error(`Erro na estimativa: ${msg}`)
   }
   return res.json()
 }
 
+export async function runQueryBatch(queries) {
+  // Executa várias consultas numa só requisição (ex.: um dashboard inteiro);
+  // o backend roda as que não estão em cache em paralelo. Devolve os
+  // resultados na ordem recebida; um item que falhou traz { error, status }
+  // sem rows, e cada view decide o que mostrar (ver batchErrors).
+  const data = await postWithETag('/api/query/batch', { queries }, 'Erro na consulta')
+  return data.results
+}
+
+export function batchErrors(results) {
+  // Mensagem com os erros dos itens de runQueryBatch ('' se nenhum falhou)
+  return results
+    .filter((r) => r.error)
+    .map((r) => `Erro na consulta: ${typeof r.error === 'string' ? r.error : JSON.stringify(r.error)}`)
+    .join(' | ')
+}
+
+export async function runGroupingSets(body) {
+  // Mesmas medidas/filtros em várias quebras ("groupings") com uma única
+  // leitura no banco; retorna { sets: [{ dimensions, columns, rows }] }
+  return postWithETag('/api/query/grouping-sets', body, 'Erro na consulta')
+}
+
 export async function getDistinct(body) {
   // Busca valores únicos de uma dimensão, respeitando filtros e papel
-  const res = await fetch(`${API_BASE}/api/distinct`, {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(body),
-  })
-  if (!res.ok) {
-    const msg = await res.text()
-    throw new Error(`Erro no distinct: ${msg}`)
-  }
-  return res.json()
+  return postWithETag('/api/distinct', body, 'Erro no distinct')
 }
 
 export async function getDataRange(cube) {
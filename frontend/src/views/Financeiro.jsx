@@ -2,7 +2,7 @@
 // - Melhoria: legendas de pizza no bottom; barras com espaçamento extra da legenda
 // - Usa Explorer para análises ad-hoc com nomes amigáveis e tabela alinhada
 import React, { useEffect, useMemo, useState } from 'react'
-import { runQuery, getDataRange } from '@/api'
+import { runQueryBatch, batchErrors, getDataRange } from '@/api'
 import { todayStrLocal, monthStartLocal } from '@/lib/date'
 import { ResponsiveContainer, PieChart, Pie, Cell, Tooltip, Legend, BarChart, Bar, XAxis, YAxis, CartesianGrid } from 'recharts'
 import Explorer from '@/components/Explorer'
@@ -82,38 +82,42 @@ export default function FinanceiroView({ meta, role }) {
       setLoading(true)
       setError('')
       try {
-        const sm = await runQuery({
-          role: 'financeiro',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['sales.status'],
-          filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
-          order: [{ by: 'sales.total_amount', dir: 'desc' }],
-          limit: 10
-        })
+        // As três consultas numa só requisição, executadas em paralelo
+        const results = await runQueryBatch([
+          {
+            role: 'financeiro',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['sales.status'],
+            filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
+            order: [{ by: 'sales.total_amount', dir: 'desc' }],
+            limit: 10
+          },
+          {
+            role: 'financeiro',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['channel.name'],
+            filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
+            order: [{ by: 'sales.total_amount', dir: 'desc' }],
+            limit: 10
+          },
+          {
+            role: 'financeiro',
+            cube: 'payments',
+            measures: ['payments.amount','payments.count'],
+            dimensions: ['payment.type'],
+            filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
+            order: [{ by: 'payments.amount', dir: 'desc' }],
+            limit: 20
+          }
+        ])
+        // cada seção mostra o que veio; itens com erro ficam vazios
+        const [sm, cm, pm] = results
         setStatusMix(sm.rows || [])
-
-        const cm = await runQuery({
-          role: 'financeiro',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['channel.name'],
-          filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
-          order: [{ by: 'sales.total_amount', dir: 'desc' }],
-          limit: 10
-        })
         setChannelMix(cm.rows || [])
-
-        const pm = await runQuery({
-          role: 'financeiro',
-          cube: 'payments',
-          measures: ['payments.amount','payments.count'],
-          dimensions: ['payment.type'],
-          filters: [ { dimension: 'time.date', op: 'between', values: currentRange } ],
-          order: [{ by: 'payments.amount', dir: 'desc' }],
-          limit: 20
-        })
         setPaymentMix(pm.rows || [])
+        setError(batchErrors(results))
       } catch (e) {
         setError(String(e.message || e))
       } finally {
@@ -2,7 +2,7 @@
 // - Seções: Top 10 lojas (barras), Faturamento por canal (pizza), Evolução mensal (linha)
 // - Compartilha período com outras views via localStorage
 import React, { useEffect, useMemo, useState } from 'react'
-import { runQuery, getDataRange } from '@/api'
+import { runQueryBatch, batchErrors, getDataRange } from '@/api'
 import { todayStrLocal, monthStartLocal } from '@/lib/date'
 import { ResponsiveContainer, BarChart, Bar, XAxis, YAxis, Tooltip, Legend, CartesianGrid, PieChart, Pie, Cell, LineChart, Line } from 'recharts'
 import Explorer from '@/components/Explorer'
@@ -97,51 +97,55 @@ export default function GerenciaView({ meta, role }) {
       setLoading(true)
       setError('')
       try {
-        // Top 10 lojas por faturamento no mês
-        const ts = await runQuery({
-          role: 'gerencia',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['store.name'],
-          filters: [
-            { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
-            { dimension: 'time.date', op: 'between', values: currentRange }
-          ],
-          order: [{ by: 'sales.total_amount', dir: 'desc' }],
-          limit: 10
-        })
+        // As três consultas numa só requisição, executadas em paralelo
+        const results = await runQueryBatch([
+          // Top 10 lojas por faturamento no mês
+          {
+            role: 'gerencia',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['store.name'],
+            filters: [
+              { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
+              { dimension: 'time.date', op: 'between', values: currentRange }
+            ],
+            order: [{ by: 'sales.total_amount', dir: 'desc' }],
+            limit: 10
+          },
+          // Faturamento por canal no mês
+          {
+            role: 'gerencia',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['channel.name'],
+            filters: [
+              { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
+              { dimension: 'time.date', op: 'between', values: currentRange }
+            ],
+            order: [{ by: 'sales.total_amount', dir: 'desc' }],
+            limit: 10
+          },
+          // Evolução mensal (6 meses)
+          {
+            role: 'gerencia',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['time.date'],
+            filters: [
+              { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
+              { dimension: 'time.date', op: 'between', values: lastMonthsRange }
+            ],
+            granularity: 'month',
+            order: [{ by: 'time.date', dir: 'asc' }],
+            limit: 12
+          }
+        ])
+        // cada seção mostra o que veio; itens com erro ficam vazios
+        const [ts, bc, mo] = results
         setTopStores(ts.rows || [])
-
-        // Faturamento por canal no mês
-        const bc = await runQuery({
-          role: 'gerencia',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['channel.name'],
-          filters: [
-            { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
-            { dimension: 'time.date', op: 'between', values: currentRange }
-          ],
-          order: [{ by: 'sales.total_amount', dir: 'desc' }],
-          limit: 10
-        })
         setByChannel(bc.rows || [])
-
-        // Evolução mensal (6 meses)
-        const mo = await runQuery({
-          role: 'gerencia',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['time.date'],
-          filters: [
-            { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
-            { dimension: 'time.date', op: 'between', values: lastMonthsRange }
-          ],
-          granularity: 'month',
-          order: [{ by: 'time.date', dir: 'asc' }],
-          limit: 12
-        })
         setMonthly(mo.rows || [])
+        setError(batchErrors(results))
       } catch (e) {
         setError(String(e.message || e))
       } finally {
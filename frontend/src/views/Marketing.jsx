@@ -3,7 +3,7 @@
 // - Exibe faturamento por canal (linha) e Top 10 produtos (barras)
 // - Integra com o Explorer para análise livre
 import React, { useEffect, useMemo, useState } from 'react'
-import { runQuery, getDataRange } from '@/api'
+import { runQueryBatch, batchErrors, getDataRange } from '@/api'
 import { todayStrLocal, monthStartLocal } from '@/lib/date'
 import { ResponsiveContainer, LineChart, Line, XAxis, YAxis, Tooltip, Legend, CartesianGrid, BarChart, Bar } from 'recharts'
 import Explorer from '@/components/Explorer'
@@ -98,39 +98,44 @@ export default function MarketingView({ meta, role }) {
       setLoading(true)
       setError('')
       try {
-        // Overview diário (faturamento, pedidos, ticket) do mês
-        const ov = await runQuery({
-          role: 'marketing',
-          cube: 'sales',
-          measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
-          dimensions: ['time.date','channel.name'],
-          filters: [
-            { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
-            { dimension: 'time.date', op: 'between', values: currentRange }
-          ],
-          granularity: 'day',
-          order: [{ by: 'sales.total_amount', dir: 'desc' }],
-          limit: 1000
-        })
-  setOverviewRows(ov.rows || [])
-  // captura canais únicos para cores/linhas
-  const chset = new Set((ov.rows||[]).map(r => r['channel.name']).filter(Boolean))
-  setChannels(Array.from(chset))
-
-        // Top 10 produtos do mês por receita
-        const tp = await runQuery({
-          role: 'marketing',
-          cube: 'products',
-          measures: ['products.revenue','products.quantity'],
-          dimensions: ['product.name','store.name','channel.name','time.date'],
-          filters: [
-            { dimension: 'time.date', op: 'between', values: currentRange }
-          ],
-          granularity: 'day',
-          order: [{ by: 'products.revenue', dir: 'desc' }],
-          limit: 10
-        })
+        // As duas consultas numa só requisição, executadas em paralelo
+        const results = await runQueryBatch([
+          // Overview diário (faturamento, pedidos, ticket) do mês
+          {
+            role: 'marketing',
+            cube: 'sales',
+            measures: ['sales.total_amount','sales.orders','sales.ticket_medio'],
+            dimensions: ['time.date','channel.name'],
+            filters: [
+              { dimension: 'sales.status', op: 'equals', values: ['COMPLETED'] },
+              { dimension: 'time.date', op: 'between', values: currentRange }
+            ],
+            granularity: 'day',
+            order: [{ by: 'sales.total_amount', dir: 'desc' }],
+            limit: 1000
+          },
+          // Top 10 produtos do mês por receita
+          {
+            role: 'marketing',
+            cube: 'products',
+            measures: ['products.revenue','products.quantity'],
+            dimensions: ['product.name','store.name','channel.name','time.date'],
+            filters: [
+              { dimension: 'time.date', op: 'between', values: currentRange }
+            ],
+            granularity: 'day',
+            order: [{ by: 'products.revenue', dir: 'desc' }],
+            limit: 10
+          }
+        ])
+        // cada seção mostra o que veio; itens com erro ficam vazios
+        const [ov, tp] = results
+        setOverviewRows(ov.rows || [])
+        // captura canais únicos para cores/linhas
+        const chset = new Set((ov.rows||[]).map(r => r['channel.name']).filter(Boolean))
+        setChannels(Array.from(chset))
         setTopProducts(tp.rows || [])
+        setError(batchErrors(results))
       } catch (e) {
         setError(String(e.message || e))
       } finally {